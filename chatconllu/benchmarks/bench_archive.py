@@ -0,0 +1,75 @@
+"""Time to convert a corpus of many small CHAT files with one output file
+each, against streaming all outputs into a single archive, sequentially
+and in a pool of processes.
+
+    python benchmarks/bench_archive.py [--files N] [--rounds N] [file.cha]
+
+The defaults take under 20 s; e.g. `--files 1000 --rounds 3` for a
+larger corpus takes several minutes.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from logger import logger
+from helpers.archive import ArchiveSink
+import chatparser
+
+
+def corpus(directory, source, count):
+	"""count copies of source in directory, 50 to a folder."""
+	files = []
+	for i in range(count):
+		f = Path(directory, f"child{i // 50:03}", f"{i:05}.cha")
+		f.parent.mkdir(parents=True, exist_ok=True)
+		shutil.copyfile(source, f)
+		files.append(f)
+	return files
+
+
+def run(files, jobs, archive=None):
+	"""Seconds to convert files, and the number of files written."""
+	for f in files:
+		f.with_suffix('.conllu').unlink(missing_ok=True)
+	start = time.perf_counter()
+	if archive is None:
+		chatparser.chat2conllu(files, jobs=jobs)
+	else:
+		with ArchiveSink(archive, files[0].parents[1]) as sink:
+			chatparser.chat2conllu(files, jobs=jobs, sink=sink)
+	seconds = time.perf_counter() - start
+	written = 1 if archive is not None else sum(f.with_suffix('.conllu').is_file() for f in files)
+	return seconds, written
+
+
+def main():
+	argp = argparse.ArgumentParser()
+	argp.add_argument("source", nargs="?", default=ROOT / 'tests' / '07.cha', type=Path, help="CHAT file copied to make the corpus")
+	argp.add_argument("--files", type=int, default=50, help="number of files in the corpus")
+	argp.add_argument("--rounds", type=int, default=2, help="runs of each configuration, the fastest is reported")
+	args = argp.parse_args()
+	logger.setLevel(logging.ERROR)
+	with tempfile.TemporaryDirectory() as tmp:
+		files = corpus(Path(tmp, 'corpus'), args.source, args.files)
+		print(f"{args.files} files of {args.source.stat().st_size:,} bytes")
+		for jobs in [1, 4]:
+			for name in [None, 'out.tar', 'out.tar.gz', 'out.zip']:
+				archive = Path(tmp, name) if name else None
+				seconds, written = min(run(files, jobs, archive) for _ in range(args.rounds))
+				size = archive.stat().st_size if archive else sum(f.with_suffix('.conllu').stat().st_size for f in files)
+				print(f"-j {jobs}  {name or 'one file each':14} {seconds:7.2f} s  {args.files / seconds:7.1f} files/s  "
+					  f"{written:6} files written, {size / 1e6:7.1f} MB")
+				if archive:
+					os.remove(archive)
+
+
+if __name__ == '__main__':
+	main()
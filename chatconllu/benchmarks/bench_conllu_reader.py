@@ -0,0 +1,69 @@
+"""Throughput and memory per sentence of reading CoNLL-U with pyconll and
+with the built-in reader used by conllu2chat.
+
+    python benchmarks/bench_conllu_reader.py [files.conllu ...]
+
+Without files, tests/07.cha is converted in memory and read instead.
+"""
+import io
+import sys
+import time
+import logging
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pyconll
+
+from logger import logger
+import chatparser
+from helpers.conllu import iter_conllu
+
+
+def sample():
+	out = io.StringIO()
+	chatparser.chat_file2conllu(Path(__file__).resolve().parents[1] / 'tests' / '07.cha', out=out)
+	return out.getvalue()
+
+
+def pyconll_sentences(text):
+	return pyconll.iter_from_string(text)
+
+
+def native_sentences(text):
+	return iter_conllu(io.StringIO(text))
+
+
+def throughput(read, texts, repeat):
+	start = time.perf_counter()
+	count = 0
+	for _ in range(repeat):
+		for text in texts:
+			for sent in read(text):
+				count += 1
+	return count / (time.perf_counter() - start)
+
+
+def memory(read, texts):
+	"""Bytes allocated per sentence while all sentences are held."""
+	tracemalloc.start()
+	sents = [sent for text in texts for sent in read(text)]
+	size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return size / max(1, len(sents))
+
+
+def main():
+	logger.setLevel(logging.ERROR)
+	texts = [Path(f).read_text(encoding='utf-8') for f in sys.argv[1:]] or [sample()]
+	lines = sum(text.count('\n') for text in texts)
+	repeat = max(1, 200000 // max(1, lines))
+	print(f"{len(texts)} files, {lines} lines, x{repeat}")
+	for name, read in [('pyconll', pyconll_sentences), ('native', native_sentences)]:
+		list(read(texts[0]))  # warm up
+		print(f"{name:8} {throughput(read, texts, repeat):10,.0f} sentences/s {memory(read, texts):10,.0f} bytes/sentence")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,64 @@
+"""Fuzz the clean_utterance patterns and normalise_utterance() with long
+strings that almost match a code, and check that each one is handled
+within a time bound that does not depend on the string's length.
+
+    python benchmarks/bench_near_miss.py [seed]
+"""
+import sys
+import time
+import random
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from helpers import clean_utterance as cu
+
+PATTERNS = ['delete_prev', 'to_omit', 'start_bracket', 'to_replace', 'overlap',
+			'special_terminators', 'markup', 'glued']
+PREFIXES = ["[= ", "[% ", "[? ", "[/", "[: ", "[^", "[x ", "(", "(1:", "+", "+\"", "<", ""]
+FILLERS = ["a", "a'", " a", "a ", "1", "1:", ".", "(", "@", "-", "\"", "é", "[", "<"]
+ENDINGS = ["", "!", "]", "] [/x", "] [", " ]", "'", ":", ")", "]]"]
+LENGTHS = [1000, 4000, 16000]
+BOUND = 1e-5  # seconds per character
+
+
+def near_miss(rng, n):
+	filler = ''.join(rng.choice(FILLERS) for _ in range(rng.randint(1, 3)))
+	body = (filler * (n // len(filler) + 1))[:n]
+	return rng.choice(PREFIXES) + body + rng.choice(ENDINGS)
+
+
+def timed(func, s):
+	start = time.perf_counter()
+	func(s)
+	return time.perf_counter() - start
+
+
+def main():
+	rng = random.Random(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+	funcs = [(p, getattr(cu, p).match) for p in PATTERNS]
+	funcs += [(p + '.sub', lambda s, p=p: getattr(cu, p).sub('', s)) for p in PATTERNS]
+	funcs += [('normalise_utterance', cu.normalise_utterance),
+			  ('normalise_utterance(fast=False)', lambda s: cu.normalise_utterance(s, fast=False))]
+	failures = 0
+	for n in LENGTHS:
+		worst = {}
+		for _ in range(50):
+			s = near_miss(rng, n)
+			for name, func in funcs:
+				try:
+					t = timed(func, s)
+				except Exception:  # the reference path does not parse every line
+					continue
+				if t > worst.get(name, (0, ''))[0]:
+					worst[name] = (t, s)
+		print(f"== {n} characters, slowest per string")
+		for name, (t, s) in worst.items():
+			slow = t > BOUND * len(s)
+			failures += slow
+			print(f"{name:32} {t * 1000:9.3f} ms{'  TOO SLOW: ' + repr(s[:40]) if slow else ''}")
+	assert not failures, f"{failures} strings took more than {BOUND * 1e6:.0f} µs per character"
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,50 @@
+"""Share of main-tier lines taking the plain-line fast path of
+normalise_utterance(), and lines/s of the reference state machine, of the
+single-pass engine (scan_utterance()) and of normalise_utterance(fast=True).
+
+    python benchmarks/bench_normalise.py [files.cha ...]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import chatparser
+from helpers.clean_utterance import normalise_utterance, is_plain, scan_utterance
+
+
+def main_lines(files):
+	lines = []
+	for f in files:
+		with open(f, encoding='utf-8') as fp:
+			for _, utterance in chatparser.iter_chat(fp):
+				lines.append(utterance[0].split('\t')[-1])
+	return lines
+
+
+def run(func, lines, repeat):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		for l in lines:
+			func(l)
+	return len(lines) * repeat / (time.perf_counter() - start)
+
+
+def main():
+	files = sys.argv[1:] or [Path(__file__).resolve().parents[1] / 'tests' / '07.cha']
+	lines = main_lines(files)
+	plain = sum(1 for l in lines if is_plain(l))
+	repeat = max(1, 100000 // max(1, len(lines)))
+
+	full = run(lambda l: normalise_utterance(l, fast=False), lines, repeat)
+	engine = run(scan_utterance, lines, repeat)
+	fast = run(normalise_utterance, lines, repeat)
+	print(f"{len(lines)} utterances, {plain} ({plain / max(1, len(lines)):.1%}) take the fast path")
+	print(f"reference: {full:12,.0f} lines/s")
+	print(f"engine:    {engine:12,.0f} lines/s ({engine / full:.1f}x)")
+	print(f"fast path: {fast:12,.0f} lines/s ({fast / full:.1f}x)")
+
+
+if __name__ == '__main__':
+	main()
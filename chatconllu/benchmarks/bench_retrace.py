@@ -0,0 +1,57 @@
+"""Retracing resolution on synthetic utterances with hundreds of retrace
+markers and deeply nested scopes. The time per token should stay flat as
+the utterances grow.
+
+    python benchmarks/bench_retrace.py
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from helpers.clean_utterance import delete, scan_utterance
+
+SIZES = [100, 400, 1600]
+
+
+def retracings(n):
+	"""n retracings, mixing replacements, error codes and repetitions."""
+	parts = ["<I want> [/]", "dog [: cat] [//]", "a [* s:r] [/]", "go [x 3] [//]", "the"]
+	return ' '.join(parts[i % len(parts)] for i in range(n)) + " ."
+
+
+def nested_line(n):
+	"""n nested scopes, each closed and retraced."""
+	return "<a " * n + "b" + "> [/] c" * n + " ."
+
+
+def nested_groups(n):
+	"""n nested lists, each followed by a retrace marker."""
+	groups = ['b']
+	for _ in range(n):
+		groups = ['a', groups, '[/]', 'c']
+	return groups
+
+
+def run(func, arg, tokens, repeat=5):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		func(arg)
+	return (time.perf_counter() - start) / (repeat * tokens) * 1e6
+
+
+def main():
+	print(f"{'tokens':>8} {'retracings':>12} {'nested line':>12} {'nested groups':>14}  (µs/token)")
+	for n in SIZES:
+		flat = retracings(n)
+		nested = nested_line(n)
+		tokens = len(flat.split())
+		print(f"{tokens:8} "
+			  f"{run(scan_utterance, flat, tokens):12.2f} "
+			  f"{run(scan_utterance, nested, len(nested.split())):12.2f} "
+			  f"{run(delete, nested_groups(n), 4 * n):14.2f}")
+
+
+if __name__ == '__main__':
+	main()
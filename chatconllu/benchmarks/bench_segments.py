@@ -0,0 +1,71 @@
+"""Token-level throughput of %mor/%gra segment decoding, with and without
+the segment caches.
+
+    python benchmarks/bench_segments.py [files.cha ...]
+"""
+import sys
+import time
+import logging
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from logger import logger
+import chatparser
+
+DECODERS = ['get_lemma_and_feats', 'parse_mor', 'parse_sub', 'to_upos', 'parse_gra', 'mor2feats']
+
+
+def segments(files):
+	mor, gra = [], []
+	for f in files:
+		with open(f, encoding='utf-8') as fp:
+			for _, utterance in chatparser.iter_chat(fp):
+				for tier in utterance[1:]:
+					if tier.startswith('%mor:'):
+						mor.extend(tier.split('\t')[-1].split(' '))
+					elif tier.startswith('%gra:'):
+						gra.extend(tier.split('\t')[-1].split(' '))
+	return mor, gra
+
+
+def decode(mor, gra):
+	for m in mor:
+		is_multi = '~' in m or '$' in m
+		for xpos, *_ in (chatparser.get_lemma_and_feats(m, is_multi) if is_multi else [chatparser.get_lemma_and_feats(m)]):
+			chatparser.to_upos(xpos.replace('+', ''))
+	for g in gra:
+		chatparser.parse_gra(g)
+
+
+def run(mor, gra, repeat):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		decode(mor, gra)
+	return (len(mor) + len(gra)) * repeat / (time.perf_counter() - start)
+
+
+def main():
+	files = sys.argv[1:] or [Path(__file__).resolve().parents[1] / 'tests' / '07.cha']
+	logger.setLevel(logging.ERROR)
+	mor, gra = segments(files)
+	repeat = max(1, 200000 // max(1, len(mor) + len(gra)))
+
+	cached = {n: getattr(chatparser, n) for n in DECODERS}
+	for n, f in cached.items():  # decoders look each other up as module globals
+		setattr(chatparser, n, f.__wrapped__)
+	uncached = run(mor, gra, repeat)
+	for n, f in cached.items():
+		setattr(chatparser, n, f)
+
+	run(mor, gra, 1)  # warm up
+	warm = run(mor, gra, repeat)
+	print(f"{len(mor)} %mor and {len(gra)} %gra segments, x{repeat}")
+	print(f"uncached: {uncached:12,.0f} segments/s")
+	print(f"cached:   {warm:12,.0f} segments/s ({warm / uncached:.1f}x)")
+	for n, info in chatparser.segment_cache_info().items():
+		print(f"  {n}: {info}")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,105 @@
+"""Lines/s of CoNLL-U serialization of parsed sentences, for every
+combination of the clear flags, against the former mutating, `+=` and
+str.replace based serializer.
+
+    python benchmarks/bench_serialize.py [files.cha ...]
+"""
+import sys
+import copy
+import time
+import logging
+import itertools
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from logger import logger
+import chatparser
+
+
+def legacy_token_str(tok, clear_mor, clear_gra, clear_misc):
+	"""Token.conllu_str before it stopped writing 'None' into cleared fields."""
+	if tok.multi:
+		return legacy_multi_str(tok, clear_mor, clear_gra, clear_misc)
+	feats = 'None' if not tok.feats or clear_mor else "|".join(tok.feats)
+	if clear_mor:
+		tok.lemma = tok.upos = tok.xpos = tok.feats = 'None'
+	if clear_gra:
+		tok.head = tok.deprel = tok.deps = 'None'
+	if clear_misc:
+		tok.misc = 'None'
+	s = f"{tok.index}\t{tok.form}\t{tok.lemma}\t{tok.upos}\t{tok.xpos}\t{feats}\t{tok.head}\t{tok.deprel}\t{tok.deps}\t{tok.misc}\n"
+	return s.replace('None', '_')
+
+
+def legacy_multi_str(tok, clear_mor, clear_gra, clear_misc):
+	idx = "-".join((str(tok.index), str(tok.multi)))
+	misch = ['type=' + '^'.join(tok.type) if tok.type and not clear_misc else 'None']
+	s = "\t".join([idx, tok.form] + ['None'] * 7 + misch).replace('None', '_')
+	for n, i in enumerate(range(int(tok.index), int(tok.multi)+1)):
+		s += "\n"
+		if clear_mor:
+			lemma = upos = xpos = feats = 'None'
+		else:
+			lemma = tok.lemma[n]
+			upos = tok.upos[n] if tok.upos else 'None'
+			xpos = tok.xpos[n]
+			feats = "|".join(tok.feats[n]) if tok.feats[n] else 'None'
+		if clear_gra:
+			head = deprel = deps = 'None'
+		else:
+			head = tok.head[n] if tok.head is not None else 'None'
+			deprel = tok.deprel[n] if tok.deprel else 'None'
+			deps = tok.deps[n] if tok.deps else 'None'
+		misc = 'None' if clear_misc else (tok.misc[n] if tok.misc[n] else 'None')
+		s += f"{i}\t{tok.lemma[n]}\t{lemma}\t{upos}\t{xpos}\t{feats}\t{head}\t{deprel}\t{deps}\t{misc}"
+		s = s.replace('None', '_')
+	return s + "\n"
+
+
+def legacy_sentence_str(sent, clear_mor, clear_gra, clear_misc):
+	s = ""
+	for tok in sent.toks:
+		s += legacy_token_str(tok, clear_mor, clear_gra, clear_misc)
+	return s
+
+
+def sentences(files):
+	sents = []
+	for f in files:
+		with open(f, encoding='utf-8') as fp:
+			for idx, (_, utterance) in enumerate(chatparser.iter_chat(fp)):
+				sent = chatparser.create_sentence(idx, utterance)
+				if sent.toks:
+					sents.append(sent)
+	return sents
+
+
+def run(serialize, sents, flags, repeat, rounds=3):
+	"""Best lines/s of several rounds."""
+	best = 0
+	for _ in range(rounds):
+		lines = 0
+		start = time.perf_counter()
+		for _ in range(repeat):
+			for sent in sents:
+				lines += serialize(sent, *flags).count("\n")
+		best = max(best, lines / (time.perf_counter() - start))
+	return best
+
+
+def main():
+	files = sys.argv[1:] or [Path(__file__).resolve().parents[1] / 'tests' / '07.cha']
+	logger.setLevel(logging.ERROR)
+	sents = sentences(files)
+	repeat = max(1, 20000 // max(1, len(sents)))
+	print(f"{len(sents)} sentences, x{repeat}")
+	for flags in itertools.product([False, True], repeat=3):
+		legacy = run(legacy_sentence_str, copy.deepcopy(sents), flags, repeat)
+		current = run(chatparser.Sentence.conllu_str, sents, flags, repeat)
+		name = " ".join(n for n, on in zip(['--no-mor', '--no-gra', '--no-misc'], flags) if on) or "full"
+		print(f"{name:28} legacy: {legacy:10,.0f} lines/s   current: {current:10,.0f} lines/s ({current / legacy:.2f}x)")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,74 @@
+"""Latency of converting single utterances and whole files through the
+conversion server, against starting a new interpreter for each file.
+
+    python benchmarks/bench_server.py [file.cha]
+"""
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from urllib.request import urlopen
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from logger import logger
+import chatparser
+import server
+
+
+def utterances(text):
+	"""The utterances of a CHAT text, each with its dependent tiers."""
+	blocks = []
+	for line in text.splitlines(keepends=True):
+		if line.startswith('*'):
+			blocks.append(line)
+		elif line[:1] in '%\t' and blocks:  # dependent tiers and continuation lines
+			blocks[-1] += line
+	return blocks
+
+
+def latencies(url, bodies):
+	times = []
+	for body in bodies:
+		start = time.perf_counter()
+		urlopen(url, body.encode('utf-8')).read()
+		times.append(time.perf_counter() - start)
+	return sorted(times)
+
+
+def report(name, times):
+	ms = [t * 1000 for t in times]
+	print(f"{name:34} p50 {ms[len(ms) // 2]:8.2f} ms  p95 {ms[int(len(ms) * 0.95)]:8.2f} ms  ({len(ms)} requests)")
+
+
+def main():
+	logger.setLevel(logging.ERROR)
+	f = Path(sys.argv[1] if len(sys.argv) > 1 else ROOT / 'tests' / '07.cha')
+	text = f.read_text(encoding='utf-8')
+	blocks = utterances(text)
+
+	httpd = server.ConversionServer(("127.0.0.1", 0))
+	threading.Thread(target=httpd.serve_forever, daemon=True).start()
+	url = f"http://127.0.0.1:{httpd.server_port}/chat2conllu"
+	report("server, utterances, cold caches", latencies(url, blocks))
+	report("server, utterances, warm caches", latencies(url, blocks))
+	report("server, whole file", latencies(url, [text] * 20))
+	httpd.shutdown()
+
+	times = []
+	with tempfile.TemporaryDirectory() as cwd:
+		for _ in range(5):
+			start = time.perf_counter()
+			subprocess.run([sys.executable, '-c', f'import chatparser, pathlib, io; chatparser.chat_file2conllu(pathlib.Path({str(f)!r}), out=io.StringIO())'],
+						   cwd=cwd, env=dict(os.environ, PYTHONPATH=str(ROOT)), check=True, capture_output=True)
+			times.append(time.perf_counter() - start)
+	report("new interpreter, whole file", sorted(times))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,44 @@
+"""Import time of the CLI and of each converter, as reported by
+`python -X importtime` in a fresh interpreter run in an empty directory,
+with the slowest modules each one pulls in.
+
+    python benchmarks/bench_startup.py [modules ...]
+"""
+import os
+import sys
+import tempfile
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def import_times(module, cwd=None):
+	"""{name: (self, cumulative) microseconds} of the modules imported by
+	`import module` in a new interpreter started in cwd.
+	"""
+	env = dict(os.environ, PYTHONPATH=str(ROOT))
+	result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+							cwd=cwd, env=env, capture_output=True, text=True, check=True)
+	times = {}
+	for line in result.stderr.splitlines():
+		if not line.startswith('import time:') or 'cumulative' in line:
+			continue
+		own, cumulative, name = line[len('import time:'):].split('|')
+		times[name.strip()] = (int(own), int(cumulative))
+	return times
+
+
+def main():
+	modules = sys.argv[1:] or ['cli', 'chatparser', 'conlluparser']
+	with tempfile.TemporaryDirectory() as cwd:
+		for module in modules:
+			times = min((import_times(module, cwd) for _ in range(5)), key=lambda t: t[module][1])
+			print(f"{module:14} {times[module][1] / 1000:8.1f} ms, {len(times)} modules")
+			for name, (_, cumulative) in sorted(times.items(), key=lambda t: -t[1][1])[1:6]:
+				print(f"    {name:28} {cumulative / 1000:8.1f} ms")
+		print(f"files left in the working directory: {os.listdir(cwd)}")
+
+
+if __name__ == '__main__':
+	main()
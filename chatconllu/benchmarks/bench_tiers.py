@@ -0,0 +1,63 @@
+"""Sentences/s of reconstructing the dependent tiers of parsed CoNLL-U
+sentences with conlluparser.construct_tiers, apart from reading and
+writing files, for the tiers conllu2chat can reconstruct or generate.
+
+    python benchmarks/bench_tiers.py [files.conllu ...]
+
+Without files, tests/07.cha is converted in memory and read instead.
+"""
+import io
+import sys
+import time
+import logging
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from logger import logger
+import chatparser
+import conlluparser
+from helpers.conllu import iter_conllu
+
+MODES = [
+	('%mor %gra', {}),
+	('%mor', {'has_gra': False}),
+	('%gra', {'has_mor': False}),
+	('--new-mor --new-gra', {'generate_mor': True, 'generate_gra': True}),
+	('--cnl --pos', {'generate_cnl': True, 'generate_pos': True}),
+	('all', {'generate_mor': True, 'generate_gra': True, 'generate_cnl': True, 'generate_pos': True}),
+]
+
+
+def sample():
+	out = io.StringIO()
+	chatparser.chat_file2conllu(Path(__file__).resolve().parents[1] / 'tests' / '07.cha', out=out)
+	return out.getvalue()
+
+
+def run(sents, options, repeat, rounds=3):
+	"""Best sentences/s of several rounds."""
+	best = 0
+	for _ in range(rounds):
+		start = time.perf_counter()
+		for _ in range(repeat):
+			for sent, has_mor, has_gra in sents:
+				conlluparser.construct_tiers(sent, options.get('has_mor', has_mor), options.get('has_gra', has_gra),
+											 options.get('generate_mor', False), options.get('generate_gra', False),
+											 options.get('generate_cnl', False), options.get('generate_pos', False))
+		best = max(best, len(sents) * repeat / (time.perf_counter() - start))
+	return best
+
+
+def main():
+	logger.setLevel(logging.ERROR)
+	texts = [Path(f).read_text(encoding='utf-8') for f in sys.argv[1:]] or [sample()]
+	sents = [(sent, *conlluparser.has_tiers(sent)) for text in texts for sent in iter_conllu(io.StringIO(text)) if sent.tokens]
+	repeat = max(1, 20000 // max(1, len(sents)))
+	print(f"{len(sents)} sentences, x{repeat}")
+	for name, options in MODES:
+		print(f"{name:22} {run(sents, options, repeat):10,.0f} sentences/s")
+
+
+if __name__ == '__main__':
+	main()
@@ -4,17 +4,30 @@ Utilities to parse files in CHILDES CHAT format.
 import sys, os
 import re
 import ast
+import logging
 import fileinput
+import json
+import hashlib
+from io import StringIO
 from itertools import chain
-from typing import List, Tuple, Dict, Union
+from typing import List, Tuple, Dict, Union, Iterable, Iterator
 from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from shutil import copyfileobj
+from contextlib import nullcontext, ExitStack
 
 from collections import OrderedDict
+from functools import lru_cache
 
 from logger import logger
 from helpers.sentence import Sentence
 from helpers.token import Token
 from helpers.clean_utterance import normalise_utterance
+from helpers.cache import LRUCache
+from helpers.dependency import DependencyIndex, is_root
+from helpers.conllu import TIER_ENCODING, encode_tier
+from helpers.utils import as_lines
+from helpers import diagnostics
 from features import mor2feats, is_key
 
 all_feats = set()
@@ -22,6 +35,14 @@ all_feats = set()
 PUNCT = re.compile("([,.;?!:”])")
 FEAT = re.compile(r"^\d?[A-Z]+$")
 EMPTY = ['.', '0 .', '']
+CLITIC = re.compile(r"~|\$")  # separates the words of multi-word tokens in %mor
+COMPOUND = re.compile(r"\+\w+?\|")
+MOR_FEAT = re.compile(r"[&|-]\w+")
+MOR_SPLIT = re.compile(r'[|&#-]')
+SEGMENT_CACHE_SIZE = 1 << 16  # decoded %mor/%gra segments kept per decoder
+SPOOL_SIZE = 1 << 20  # bytes of CoNLL-U kept in memory before spooling to disk
+SENT_ID = re.compile(r"^# sent_id = \d+$", re.M)
+VARIANT_FLAGS = ['no-mor', 'no-gra', 'no-misc']  # tiers an output variant can clear, see parse_variant()
 
 # ---- define unidentifiable patterns to omit----
 unidentifiable = [
@@ -141,53 +162,59 @@ GR2DEPREL = {
 	}
 
 
-def parse_chat(fp):
-	""" For a open file in CHAT format, get the utterances grouped with
-	their dependent tiers, meta data including headers and comments, and
-	the final lines of the file.
-	"""
+def iter_chat(fp, final: List[str]=None):
+	""" For a open file in CHAT format, lazily yield the utterances grouped
+	with their dependent tiers as (meta, utterance) pairs, where meta holds
+	the headers and comments preceding the utterance. Lines are consumed as
+	the file is read, so only the current utterance is kept in memory.
 
-	meta, metas = [], []
-	tiers, utterances = [], []
-	final = []
-
-	lines = fp.readlines()
-	i = 0
+	If a list is given as `final`, it is extended with the final lines of
+	the file once `@End` is reached.
+	"""
+	meta = []
+	block = None  # (meta, utterance) of the utterance waiting for its tiers
 	ltmp = ""
 
-	while i < len(lines):
+	for line in chain(fp, [None]):  # None flushes the last line
 		# ---- obtain full lines by appending tab-initiated continuations to previous lines ----
-		if not lines[i].startswith("\t"):
-			ltmp = lines[i].strip()
-			i += 1
-		while i < len(lines) and lines[i].startswith("\t"):
-			ltmp += " " + lines[i].strip()
-			i += 1
+		if line is not None and line.startswith("\t"):
+			ltmp += " " + line.strip()
+			continue
 		# ---- decide type of ltmp ----
 		#  if ltmp starts with:
 		#    *: utterance
 		#    @: meta
 		#    %: dependent tier
 		if ltmp.startswith("*"):
-			# ---- collect previous meta, clear meta ----
-			metas.append(meta)
+			# ---- previous utterance is complete ----
+			if block: yield block
+			# ---- add current line to utterance, clear meta ----
+			block = (meta, [ltmp])  # as list to hold dependent tiers
 			meta = []
-			# ---- if tiers, add to previous utterance, clear tiers ----
-			if tiers: utterances[-1].extend(tiers)
-			tiers = []
-			# ---- add current line to utterances ----
-			utterances.append([ltmp])  # as list to hold dependent tiers
 		if ltmp.startswith("@"):
-			# ---- if tiers, add to previous utterance, clear tiers ----
-			if tiers: utterances[-1].extend(tiers)
-			tiers = []
 			# ---- add current line to meta ----
 			meta.append(ltmp)
 			# ---- if EOF, store remaining meta in final ----
-			if ltmp == "@End":
+			if ltmp == "@End" and final is not None:
 				final.extend(meta)
-		if ltmp.startswith("%"):
-			tiers.append(ltmp)
+		if ltmp.startswith("%") and block:
+			block[1].append(ltmp)
+		if line is not None:
+			ltmp = line.strip()
+
+	if block: yield block
+
+def parse_chat(fp):
+	""" For a open file in CHAT format, get the utterances grouped with
+	their dependent tiers, meta data including headers and comments, and
+	the final lines of the file.
+	"""
+	metas, utterances = [], []
+	final = []
+
+	for meta, utterance in iter_chat(fp, final):
+		metas.append(meta)
+		utterances.append(utterance)
 
 	return metas, utterances, final
 
@@ -231,22 +258,20 @@ def check_token(surface: str) -> Tuple[str, str]:
 #   return GR2DEPREL[gr] if gr in GR2DEPREL else gr
 
 def root_token(tokens: List[Token]) -> int:
-	"""Get index of the real root in multi-root sentences.
-	Current solution is perhaps inefficient.
+	"""Get index of the real root in multi-root sentences by scanning the
+	tokens, see DependencyIndex.root() for repeated lookups.
 	"""
 	root_idx = -1
 	for tok in tokens:
-		if tok.deprel == 'root':
-			root_idx = tok.index
-		elif tok.deprel == 'incroot':
-			root_idx = tok.index
-		elif tok.head == '0' and tok.deprel not in ['vocative', 'parataxis']:
+		if is_root(tok):
 			root_idx = tok.index
 	return root_idx if root_idx > 0 else None
 
 
-def change_head_to_root(tok: Token, tokens: List[Token], is_multi=False, i=-1):
-	"""Store original head in MISC, change head to root."""
+def change_head_to_root(tok: Token, dep_index: DependencyIndex, is_multi=False, i=-1):
+	"""Store original head in MISC, change head to root. Values are replaced
+	rather than modified in place, since they may be shared.
+	"""
 	if is_multi and i >= 0:
 		l = list(tok.misc)
 		if l[i]:
@@ -254,20 +279,24 @@ def change_head_to_root(tok: Token, tokens: List[Token], is_multi=False, i=-1):
 		else:
 			l[i] += f"|head={str(tok.head[i])}"
 		tok.misc = tuple(l)
-		tok.head[i] = root_token(tokens)
+		head = list(tok.head)
+		head[i] = dep_index.root()
+		tok.head = head
+		dep_index.set_head(tok.index + i, head[i])
 	else:
 		if not tok.misc:
 			tok.misc = f"head={str(tok.head)}"
 		else:
 			tok.misc += f"|head={str(tok.head)}"
-		tok.head = root_token(tokens)
+		tok.head = dep_index.root()
+		dep_index.set_head(tok.index, tok.head)
 
 
-def conditional_deprel(gr: str, tok: Token, tokens: List[Token], is_multi=False, upos: str=None, lemma: str=None, i=-1) -> str:
+def conditional_deprel(gr: str, tok: Token, dep_index: DependencyIndex, is_multi=False, upos: str=None, lemma: str=None, i=-1) -> str:
 	"""Translate a given GR (grammatical relation) to its UD counterpart
 	using conditional mapping for several selected cases, the rest uses dictionary mapping.
 	Conditional mapping is based on grammatical information of other
-	tokens in the sentence.
+	tokens in the sentence, looked up in dep_index.
 
 	To-Dos:
 	--------
@@ -277,32 +306,32 @@ def conditional_deprel(gr: str, tok: Token, tokens: List[Token], is_multi=False,
 	if gr == 'beg':
 		# print("beg")
 		if upos and upos not in ['INTJ', 'PROPN', 'NOUN']:
-			logger.info("BEG but not vocative.")
+			diagnostics.note('beg', upos)
 			# print(tokens)
-			change_head_to_root(tok, tokens, is_multi, i)
+			change_head_to_root(tok, dep_index, is_multi, i)
 			# print("change head")
 			return 'parataxis'
 		elif upos in ['PROPN', 'NOUN']:
 			# print(tokens)
-			change_head_to_root(tok, tokens, is_multi, i)
+			change_head_to_root(tok, dep_index, is_multi, i)
 			# print("change head")
 			return 'vocative'
 		elif upos == 'INTJ':
 			# print(tokens)
-			change_head_to_root(tok, tokens, is_multi, i)
+			change_head_to_root(tok, dep_index, is_multi, i)
 			# print("change head")
 			return 'discourse'
 	elif gr == 'end':
-		change_head_to_root(tok, tokens, is_multi, i)
+		change_head_to_root(tok, dep_index, is_multi, i)
 		return 'parataxis'
 	# ---- dict translation ----
 	elif not gr in GR2DEPREL:
-		logger.warning(f"{gr} does not have a corresponding deprel in GR2DEPREL.")
+		diagnostics.note('deprel', gr)
 		return gr
 	else:
 		return GR2DEPREL[gr]
 
-def gr2deprel(tok: Token, tokens: List[Token], is_multi=False):
+def gr2deprel(tok: Token, dep_index: DependencyIndex, is_multi=False):
 	"""Stores original GR in MISC, translate a given GR (grammatical relation)
 	to its UD counterpart and modify deps accordingly, also works for multi-word tokens.
 	"""
@@ -323,11 +352,15 @@ def gr2deprel(tok: Token, tokens: List[Token], is_multi=False):
 			#       tmp = f"gr={tok.deprel[i]}"
 			#   tmps.append(tmp)
 			# tok.misc = tuple(tmps)
+		deprel = []
+		deps = []
 		for i, gr in enumerate(tok.deprel):
 			upos = tok.upos[i] if tok.upos else ''
 			lemma = tok.lemma[i] if tok.lemma else ''
-			tok.deprel[i] = conditional_deprel(gr, tok, tokens, is_multi, upos, lemma, i)
-			tok.deps[i] = f"{tok.head[i]}:{tok.deprel[i]}"
+			deprel.append(conditional_deprel(gr, tok, dep_index, is_multi, upos, lemma, i))
+			deps.append(f"{'_' if tok.head[i] is None else tok.head[i]}:{deprel[i]}")
+		tok.deprel = deprel
+		tok.deps = deps
 	else:
 		if not tok.misc:
 			tok.misc = f"gr={tok.deprel}"
@@ -335,21 +368,33 @@ def gr2deprel(tok: Token, tokens: List[Token], is_multi=False):
 			tok.misc += f"|gr={tok.deprel}"
 		gr = tok.deprel  # less confusing name
 		upos = tok.upos
-		tok.assign_ud_deprel(conditional_deprel(gr, tok, tokens, is_multi, upos, lemma))
-		tok.deps = f"{tok.head}:{tok.deprel}"
+		tok.assign_ud_deprel(conditional_deprel(gr, tok, dep_index, is_multi, upos, lemma))
+		tok.deps = f"{'_' if tok.head is None else tok.head}:{tok.deprel}"
 
 def to_ud_values(tokens: List[Token]) -> List[Token]:
 	""" Translate CHAT annotations to UD values, currently for GRs to deprels.
 	This method can also be extended for future decision of feature types and values
 	if one would like to convert them to UD style. (To-Do)
+
+	The dependencies of the sentence are indexed once, see DependencyIndex.
 	"""
+	dep_index = DependencyIndex(tokens)
 	for tok in tokens:
 		if type(tok.deprel) is list:  # multi-word tokens
-			gr2deprel(tok, tokens, is_multi=True)
+			gr2deprel(tok, dep_index, is_multi=True)
 		elif tok.deprel:  # normal tokens
-			gr2deprel(tok, tokens)
+			gr2deprel(tok, dep_index)
+		dep_index.advance(tok)
 	return tokens
 
+# ---- %mor/%gra segment decoders ----
+# Segments follow a Zipfian distribution, so the decoders below are memoized
+# in size-bounded caches. Their results are immutable (strings and tuples)
+# since they are shared between all tokens decoded from the same segment.
+# Those noting diagnostics are memoized with diagnostics.memoize(), so that
+# the diagnostics are counted on every call.
+
+@diagnostics.memoize(SEGMENT_CACHE_SIZE)
 def to_upos(mor_code: str) -> str:
 	"""If the given mor_code is in the predefined MOR2UPOS dict, return the
 	corresponding upos, otherwise return mor_code.
@@ -361,23 +406,26 @@ def to_upos(mor_code: str) -> str:
 
 	if not mor_code in MOR2UPOS:
 		if not re.match(PUNCT, mor_code) and not mor_code.split(':')[0].lower() in MOR2UPOS:
-			logger.warning(f"{mor_code} does not have a corresponding UPOS in MOR2UPOS.")
+			diagnostics.note('upos', mor_code)
 		return MOR2UPOS[mor_code.split(':')[0]] if mor_code.split(':')[0].lower() in MOR2UPOS else mor_code
 
 	return MOR2UPOS[mor_code] if mor_code in MOR2UPOS else mor_code
 
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
 def parse_gra(gra_segment: str) -> Tuple[str, str]:
-	head = gra_segment.split('|')[1]
-	deprel = gra_segment.split('|')[-1].lower()
+	gra = gra_segment.split('|')
+	head = gra[1]
+	deprel = gra[-1].lower()
 	return head, deprel
 
-def parse_sub(sub_segment: str)-> Tuple[Union[str, None], List[str], str, str]:
+@diagnostics.memoize(SEGMENT_CACHE_SIZE)
+def parse_sub(sub_segment: str)-> Tuple[Union[str, None], Union[Tuple[str], str], str, str]:
 	lemma = None
 	feat_str = []
 	feat = ''
 	lemma_feats, _, translation = sub_segment.partition('=')  # translation
 
-	tmps = re.findall(r"[&|-]\w+", lemma_feats)
+	tmps = MOR_FEAT.findall(lemma_feats)
 	if tmps:  # has feature
 		# feat_str = [f"FEAT={t[1:].title()}" for t in tmps]  # need to convert to UD feats
 		feat_str = [mor2feats(t) for t in tmps]
@@ -386,7 +434,7 @@ def parse_sub(sub_segment: str)-> Tuple[Union[str, None], List[str], str, str]:
 		# logger.info(feat_str)
 		feats = [f"{t}" for t in tmps]
 		feat = '^'.join(feats)
-	tmp = re.split(r'[|&#-]', lemma_feats)
+	tmp = MOR_SPLIT.split(lemma_feats)
 		# lemma = tmp[0]
 	if tmp[0] == 'I' or not re.match(FEAT, tmp[0]):  # !!! sometimes lemma is encoded
 		lemma = tmp[0]
@@ -399,15 +447,18 @@ def parse_sub(sub_segment: str)-> Tuple[Union[str, None], List[str], str, str]:
 		all_feats.update(tmps)
 	if not feat_str or not isinstance(feat_str, list):
 		feat_str = ''
+	else:
+		feat_str = tuple(feat_str)
 
 	return lemma, feat_str, translation, feat
 
+@diagnostics.memoize(SEGMENT_CACHE_SIZE)
 def parse_mor(mor_segment: str):
 	"""Given a word-level MOR segment, extract the POS tag, lemma, features and other information
 	   to be stored in the MISC field.
 	"""
 	lemma = None
-	feat_str = []
+	feat_str = ()
 	translation = None
 	feat = None
 	miscs = []
@@ -423,11 +474,11 @@ def parse_mor(mor_segment: str):
 		lemma = lemma_feats.replace('+', '')  # special case of punctuations
 		miscs.append(f"form={pos}")
 	elif '+' in lemma_feats:  # compound
-		tmps = re.split(r"\+\w+?\|", lemma_feats)
+		tmps = COMPOUND.split(lemma_feats)
 		l, f, t, feat = zip(*(parse_sub(tmp) for tmp in tmps[1:]))    # tmp[0] is empty string
 		lemma = ''.join(l)
 		if any(t): translation = '+'.join(t)  # or leave empty
-		feat_str = list(chain(*f))  # or leave empty
+		feat_str = tuple(chain(*f))  # or leave empty
 		if any(feat): miscs.append(f"feats={'+'.join(feat)}")  # or leave empty
 		ctmps = re.split(r"\+", lemma_feats)
 		# components = [f"{tuple(ctmp.split('|'))}" for ctmp in ctmps[1:]]
@@ -443,12 +494,17 @@ def parse_mor(mor_segment: str):
 	# logger.info(f"pos:{pos}\nlemma:{lemma}\nfeats:{feat_str}\nmisc:{misc}")
 	return pos, lemma, feat_str, misc
 
-def get_lemma_and_feats(mor_segment: str, is_multi=False) -> Union[List[Tuple], Tuple]:
+@diagnostics.memoize(SEGMENT_CACHE_SIZE)
+def get_lemma_and_feats(mor_segment: str, is_multi=False) -> Union[Tuple[Tuple], Tuple]:
 	if is_multi:
-		return [parse_mor(l) for l in re.split(r"~|\$", mor_segment)]  # ['pro:int|what', 'aux|be&3S']
+		return tuple(parse_mor(l) for l in CLITIC.split(mor_segment))  # ['pro:int|what', 'aux|be&3S']
 	else:
 		return parse_mor(mor_segment)
 
+def segment_cache_info() -> Dict[str, 'functools._CacheInfo']:
+	"""Hit/miss statistics of the memoized segment decoders."""
+	return {f.__name__: f.cache_info() for f in (get_lemma_and_feats, parse_mor, parse_sub, to_upos, parse_gra, mor2feats)}
+
 def new_misc_value(form:str, misc:str):
 	if not misc:
 		return misc
@@ -457,11 +513,9 @@ def new_misc_value(form:str, misc:str):
 	for m in miscs:
 		if m.startswith('feats='):
 			feats = re.findall(r'\-\w+', m[6:])
-			print(feats)
 			if not feats:
 				return '|'.join(miscs)
 			for f in feats:  # process each feature string
-				print(f)
 				if f in form:
 					feats.remove(f)
 					logger.info(f"removed {f}")
@@ -518,14 +572,15 @@ def extract_token_info(checked_tokens: List[Tuple[str, str]], gra: Union[List[st
 
 	if mor:
 		idx = [x for x, g in enumerate(mor) if '~' in g or '$' in g]  # get multi-word tokens' indices in mor tier
-		span = [len(re.split(r'~|\$', mor[i])) for i in idx]
+		span = [len(CLITIC.split(mor[i])) for i in idx]
 		try:
 			assert len(clean) == len(mor)  # one-to-one correspondance between tokens and mor segments
 		except AssertionError:
-			logger.warn(f"Something went wrong: clean and mor should have the same length!")
-			logger.debug(f"utterance: {' '.join(clean)}\n")
-			logger.debug(f"mor:\t{mor}\n")
-			logger.debug(f"clean:\t{clean}\n")
+			diagnostics.note('mor_length')
+			if logger.isEnabledFor(logging.DEBUG):
+				logger.debug(f"utterance: {' '.join(clean)}\n")
+				logger.debug(f"mor:\t{mor}\n")
+				logger.debug(f"clean:\t{clean}\n")
 
 
 	## ---- test prints ----
@@ -565,12 +620,12 @@ def extract_token_info(checked_tokens: List[Tuple[str, str]], gra: Union[List[st
 		if j in idx:  # multi-word tokens, implies has mor tier
 			# m = idx.index(j)  # the current token is the m th multi-word token in this utterance
 			# index = index + m
-			num = len(re.split(r'~|\$', mor[j]))  # number of components in mwt
+			num = len(CLITIC.split(mor[j]))  # number of components in mwt
 			multi = tok_index + num - 1
 			# logger.debug(f"j:{j}\tindex:{index}\tnum:{num}\tend:{multi}")
 			# ---- get clitics type, for reconstruction of %mor  ----
-			if re.findall(r'~|\$', mor[j]):
-				type = re.findall(r'~|\$', mor[j])
+			if CLITIC.search(mor[j]):
+				type = CLITIC.findall(mor[j])
 			# ---- get token info from mor ----
 			xpos, lemma, feats, misc = zip(*get_lemma_and_feats(mor[j], is_multi=True))
 			upos = [to_upos(x.replace('+', '')) for x in xpos]
@@ -643,10 +698,35 @@ def extract_token_info(checked_tokens: List[Tuple[str, str]], gra: Union[List[st
 
 	return tokens
 
-def create_sentence(idx: int, lines: List[str]) -> Sentence:
+def create_sentence(idx: int, lines: List[str], cache: LRUCache=None) -> Sentence:
 	"""Given utterance index and all lines pertaining to the utterance,
 	create a Sentence object.
+
+	If a cache is given, an utterance whose main line and dependent tiers
+	were converted before is taken from it with only speaker and sent_id
+	rebound, and the diagnostics of its conversion are counted again.
+	Cached sentences share their tokens.
 	"""
+	diagnostics.at(idx+1)
+	if cache is None:
+		return new_sentence(idx, lines)
+	key = (lines[0].split('\t')[-1], *lines[1:])
+	cached = cache.get(key)
+	if cached is not None:
+		sent, noted = cached
+		diagnostics.replay(noted)
+		return sent.rebind(lines[0][1:4], idx+1)
+	diagnostics.capture()
+	try:
+		sent = new_sentence(idx, lines)
+	finally:
+		noted = diagnostics.release()
+	diagnostics.replay(noted)
+	cache.put(key, (sent, noted))
+	return sent
+
+def new_sentence(idx: int, lines: List[str]) -> Sentence:
+	"""Convert the utterance of create_sentence() without a cache."""
 	# ---- speaker ----
 	speaker = lines[0][1:4]
 	# print(f"speaker: {speaker}")
@@ -688,7 +768,7 @@ def create_sentence(idx: int, lines: List[str]) -> Sentence:
 	toks = extract_token_info(checked_tokens, gra, mor)
 	ud_toks = to_ud_values(toks)
 
-	return Sentence(speaker=speaker,
+	sent = Sentence(speaker=speaker,
 					tiers=tiers_dict,
 					gra=gra,
 					mor=mor,
@@ -698,93 +778,521 @@ def create_sentence(idx: int, lines: List[str]) -> Sentence:
 					sent_id=(idx+1),
 					toks=ud_toks  # should be ud_toks
 					)
+	return sent
 
-def to_conllu(filename: 'pathlib.PosixPath', metas: List[List[str]], utterances:List[List[str]], final:List[str], clear_mor=False, clear_gra=False, clear_misc=False):
+def final_sents(tail: List[Tuple[List[str], Sentence]]) -> List[str]:
+	"""Given the (meta, sentence) pairs of the empty utterances following the
+	last non-empty sentence, create the `final_*` comments storing them, last
+	utterance first.
+	"""
 	final_empty = []
-	final_idx = -1
-	sent = create_sentence(final_idx, utterances[final_idx])
-	while sent.text() in EMPTY:
-		# print(f"final sent at index {final_idx}: {sent.chat_sent}")
-		tiers = [k for k in sent.tiers.keys()]
+	for k, (meta, sent) in enumerate(reversed(tail), 1):
+		tiers = [t for t in sent.tiers.keys()]
 		tiers.reverse()
 		for t in tiers:
-			final_empty.append(f"# final_{t}_{-final_idx} = {sent.tiers.get(t)}\n")
-		final_empty.append(f"# final_{sent.speaker}_{-final_idx} = {sent.chat_sent}\n")
-		coms = [k for k in metas[final_idx]]
+			final_empty.append(f"# final_{t}_{k} = {encode_tier(' '.join(sent.tiers.get(t)))}\n")
+		final_empty.append(f"# final_{sent.speaker}_{k} = {sent.chat_sent}\n")
+		coms = [c for c in meta]
 		coms.reverse()
 		for c in coms:
 			final_empty.append(f"# final_comments = {c}\n")
-		final_idx -= 1
-		sent = create_sentence(final_idx, utterances[final_idx])
-	# print(final_empty)
-	with open(filename, mode='w', encoding='utf-8') as f:
-		# ==== write headers ====
-		for m in metas[0]:
-			f.write(f"# {m}\n")
-		empty = []
-		for idx, utterance in enumerate(utterances):
-			try:
-				sent = create_sentence(idx, utterance)
-			except IndexError as e:
+	return final_empty
+
+def sentence_blocks(entries: Iterable[Tuple[List[str], object, bool]], header: List[str], sentence=None) -> Iterator[Tuple[object, List[str], List[object], List[str]]]:
+	"""Given the (meta, sent, empty) entries of the utterances of a file in
+	order, hold each non-empty sentence back until the next one is seen and
+	yield it as (sent, meta, empty, final_empty): empty lists the empty
+	utterances before it and final_empty, for the last sentence only, holds
+	the `final_*` comments of those after it (see final_sents()); it is None
+	for the others. A file of empty utterances only gives a single block
+	whose sent is None. Nothing is yielded for a file without utterances.
+
+	The meta of the first entry, the headers of the file, is added to header
+	rather than yielded. `sentence` gives the Sentence of an empty entry for
+	final_sents(), if its sent is something else.
+	"""
+	last = None  # (sent, meta, empty) of the last non-empty sentence so far
+	tail = []  # (meta, sent) of the empty utterances following it
+	idx = -1
+	for idx, (meta, sent, empty) in enumerate(entries):
+		if idx == 0:  # headers of the file
+			header.extend(meta)
+			meta = []
+		if empty:
+			tail.append((meta, sent))
+			continue
+		if last:
+			yield last + (None,)
+		last = (sent, meta, [s for _, s in tail])
+		tail = []
+	if idx < 0:  # no utterances
+		return
+	final_empty = final_sents([(m, sentence(s) if sentence else s) for m, s in tail])
+	yield (last or (None, [], [])) + (final_empty,)
+
+def sentence_entries(blocks: Iterable[Tuple[List[str], List[str]]], cache: LRUCache=None, name: str=None) -> Iterator[Tuple[List[str], Sentence, bool]]:
+	"""Convert (meta, utterance) blocks, as yielded by `iter_chat()`, to the
+	entries of sentence_blocks(). `name` is the output logged on errors.
+	"""
+	for idx, (meta, utterance) in enumerate(blocks):
+		try:
+			sent = create_sentence(idx, utterance, cache)
+		except IndexError as e:
+			if name is not None:
 				logger.exception(e)
-				logger.info(f"writing sent {utterance} to {filename}...")
-				raise
-			if idx != 0 and metas[idx] and not sent.text() in EMPTY:  # if has comments/headers
-				for m in metas[idx]:
+				logger.info(f"writing sent {utterance} to {name}...")
+			raise
+		yield meta, sent, sent.text() in EMPTY
+
+def sentence_comments(sent: Sentence, meta: List[str], empty: List[Sentence], final_empty: List[str]) -> str:
+	"""The comments/headers written before a non-empty sentence, the
+	`final_*` comments if it is the last sentence, the empty sentences held
+	back before it and the comments of the sentence itself. Without a
+	sentence, only the `final_*` comments are written.
+	"""
+	lines = [f"# {m}\n" for m in meta]
+	lines.extend(reversed(final_empty or []))
+	if sent is None:  # a file of empty utterances only
+		return "".join(lines)
+	for empty_sent in reversed(empty):
+		lines.append(f"# empty_speaker = {empty_sent.speaker}\n")
+		lines.append(f"# empty_chat_sent = {empty_sent.chat_sent}\n")
+		for t in empty_sent.tiers.keys():
+			if empty_sent.tiers.get(t):
+				lines.append(f"# empty_{t} = {encode_tier(' '.join(empty_sent.tiers.get(t)))}\n")
+	lines.append(f"# sent_id = {sent.get_sent_id()}\n")
+	lines.append(f"# text = {sent.text()}\n")
+	lines.append(f"# chat_sent = {sent.chat_sent}\n")
+	lines.append(f"# speaker = {sent.speaker}\n")
+	for t in sent.tiers.keys():
+		lines.append(f"# {t} = {encode_tier(' '.join(sent.tiers.get(t)))}\n")
+	return "".join(lines)
+
+def write_sentence(f, sent: Sentence, meta: List[str], empty: List[Sentence], final_empty: List[str], clear_mor=False, clear_gra=False, clear_misc=False):
+	"""Write a non-empty sentence preceded by its comments (see
+	sentence_comments()) in a single write.
+	"""
+	f.write(sentence_text(sentence_comments(sent, meta, empty, final_empty), sent, clear_mor, clear_gra, clear_misc))
+
+def sentence_text(comments: str, sent: Sentence, clear_mor=False, clear_gra=False, clear_misc=False) -> str:
+	"""The CoNLL-U text of a sentence given its comments, see
+	sentence_comments(); only the comments if sent is None.
+	"""
+	if sent is None:
+		return comments
+	return comments + sent.conllu_str(clear_mor, clear_gra, clear_misc) + "\n"
+
+def open_output(filename: 'pathlib.PosixPath', out=None):
+	"""Open filename for writing, unless a text stream out is given to be
+	written to instead.
+	"""
+	return nullcontext(out) if out is not None else open(filename, mode='w', encoding='utf-8')
+
+def parse_variant(name: str) -> Tuple[str, bool, bool, bool]:
+	"""The (suffix, clear_mor, clear_gra, clear_misc) of an output variant
+	given by name: `full`, or tiers to clear joined by `+`, e.g.
+	`no-mor+no-gra`. Variants other than `full` are written to files ending
+	in `.<name>.conllu`, see variant_path().
+	"""
+	if name == 'full':
+		return ("", False, False, False)
+	cleared = name.split('+')
+	if not all(c in VARIANT_FLAGS for c in cleared):
+		raise ValueError(f"unknown output variant '{name}', expected 'full' or some of {VARIANT_FLAGS} joined by '+'")
+	return (f".{name}",) + tuple(c in cleared for c in VARIANT_FLAGS)
+
+def variant_path(f: 'pathlib.PosixPath', suffix: str) -> 'pathlib.PosixPath':
+	"""The CoNLL-U output of f for the variant with suffix."""
+	return f.with_suffix(f"{suffix}.conllu")
+
+def to_conllu(filename: 'pathlib.PosixPath', blocks: Iterable[Tuple[List[str], List[str]]], final: List[str], clear_mor=False, clear_gra=False, clear_misc=False, cache: LRUCache=None, out=None):
+	"""Convert (meta, utterance) blocks, as yielded by `iter_chat()`, and write
+	them to a CoNLL-U file while they are read.
+
+	Each utterance is converted exactly once. A non-empty sentence is held
+	back until the next one is seen, together with the empty utterances
+	around it: those before it are written as `empty_*` comments, those
+	after the last sentence as `final_*` comments. The latter are also listed
+	in the `final_sents` header, so the body is spooled and copied after the
+	headers at the end. `final` is read once all blocks are consumed.
+
+	`cache` is passed on to `create_sentence()`. If a text stream `out` is
+	given, the file is written to it rather than to filename.
+	"""
+	to_conllu_variants([(filename, (clear_mor, clear_gra, clear_misc), out)], blocks, final, cache)
+
+def to_conllu_variants(outputs: List[Tuple['pathlib.PosixPath', Tuple[bool, bool, bool], 'io.TextIOBase']], blocks: Iterable[Tuple[List[str], List[str]]], final: List[str], cache: LRUCache=None):
+	"""As to_conllu(), but write every sentence to several CoNLL-U files,
+	given as (filename, (clear_mor, clear_gra, clear_misc), out) outputs.
+	Each utterance is still converted once and its comments are written
+	once for all outputs; only the tokens are serialized for each of them.
+	"""
+	header = []
+	final_empty = None  # of the last block, None without utterances
+	with ExitStack() as stack:
+		bodies = [stack.enter_context(SpooledTemporaryFile(max_size=SPOOL_SIZE, mode='w+', encoding='utf-8')) for _ in outputs]
+		name = ', '.join(str(o[0]) for o in outputs)
+		for sent, meta, empty, final_empty in sentence_blocks(sentence_entries(blocks, cache, name), header):
+			comments = sentence_comments(sent, meta, empty, final_empty)
+			for body, (_, flags, _) in zip(bodies, outputs):
+				body.write(sentence_text(comments, sent, *flags))
+
+		for (filename, _, out), body in zip(outputs, bodies):
+			with open_output(filename, out) as f:
+				# ==== write headers ====
+				for m in header:
 					f.write(f"# {m}\n")
-			if idx == 0:
-				f.write(f"# final = {final}\n")
-				f.write(f"# final_sents = {final_empty}\n")
-
-			if idx < final_idx + len(utterances) and sent.text() in EMPTY:
-				empty.append(sent)
-
-			if isinstance(sent, Sentence) and not sent.text() in EMPTY:
-				# print(idx, sent.sent_id)
-				if idx == final_idx + len(utterances):
-					# logger.debug(1)
-					if final_empty:
-						while final_empty:
-							s = final_empty.pop()
-							f.write(s)
-				if empty:
-					while empty:
-						# logger.debug(2)
-						empty_sent = empty.pop()
-						if not isinstance(empty_sent, Sentence):
-							f.write(empty_sent)
-						else:
-							f.write(f"# empty_speaker = {empty_sent.speaker}\n")
-							f.write(f"# empty_chat_sent = {empty_sent.chat_sent}\n")
-							for t in empty_sent.tiers.keys():
-								if empty_sent.tiers.get(t):
-									f.write(f"# empty_{t} = {empty_sent.tiers.get(t)}\n")
-				if isinstance(sent, Sentence):
-					# logger.debug(3)
-					f.write(f"# sent_id = {sent.get_sent_id()}\n")
-					f.write(f"# text = {sent.text()}\n")
-					f.write(f"# chat_sent = {sent.chat_sent}\n")
-					f.write(f"# speaker = {sent.speaker}\n")
-					for t in sent.tiers.keys():
-						f.write(f"# {t} = {sent.tiers.get(t)}\n")
-					f.write(sent.conllu_str(clear_mor, clear_gra, clear_misc))
-					# f.write(sent.conllu_str())
-					f.write("\n")
-
-
-def chat2conllu(files: List['pathlib.PosixPath'], clear_mor=False, clear_gra=False, clear_misc=False):
-	for f in files:
-		# ----- skip converted files ----
-		# if f.with_suffix(".conllu").is_file():
-		#   continue
-		# ---- parse chat ----
-		logger.info(f"parsing {f}...")
-		with open(f, 'r', encoding='utf-8') as fp:
-			metas, utterances, final = parse_chat(fp)
-
-			fn = f.with_suffix(".conllu")
-			to_conllu(fn, metas, utterances, final, clear_mor, clear_gra, clear_misc)
-			# print(all_feats)
+				if final_empty is not None:  # has utterances
+					f.write(f"# {TIER_ENCODING} = raw\n")
+					f.write(f"# final = {final}\n")
+					f.write(f"# final_sents = {final_empty}\n")
+				body.seek(0)
+				copyfileobj(body, f)
+
+
+def iter_conllu_text(blocks: Iterable[Tuple[List[str], List[str]]], final: List[str], clear_mor=False, clear_gra=False, clear_misc=False, cache: LRUCache=None) -> Iterator[str]:
+	"""As to_conllu(), but lazily yield the CoNLL-U text of each sentence as
+	soon as it is complete, for streaming. As the final lines and empty
+	utterances of the file are only known at the end, the `final` and
+	`final_sents` comments are written before the comments of the last
+	sentence rather than with the headers; conllu2chat reads both layouts.
+	"""
+	header = []
+	first = True
+	for sent, meta, empty, final_empty in sentence_blocks(sentence_entries(blocks, cache), header):
+		head = ""
+		if first:  # headers of the file
+			head = "".join(f"# {m}\n" for m in header) + f"# {TIER_ENCODING} = raw\n"
+			first = False
+		if final_empty is not None:  # the last block
+			head += f"# final = {final}\n# final_sents = {final_empty}\n"
+		yield sentence_text(head + sentence_comments(sent, meta, empty, final_empty), sent, clear_mor, clear_gra, clear_misc)
+
+def iter_sentences(chat: Union[str, Iterable[str]], cache: LRUCache=None) -> Iterator[Sentence]:
+	"""Lazily convert the utterances of CHAT text, or of an iterable of its
+	lines, to Sentence objects, including empty utterances (see EMPTY).
+	"""
+	for idx, (_, utterance) in enumerate(iter_chat(as_lines(chat))):
+		yield create_sentence(idx, utterance, cache)
+
+def chat2conllu_text(chat: Union[str, Iterable[str]], clear_mor=False, clear_gra=False, clear_misc=False, cache: LRUCache=None) -> str:
+	"""Convert CHAT text, or an iterable of its lines, to CoNLL-U text as
+	chat_file2conllu() would write it, without touching the file system.
+	"""
+	out = StringIO()
+	final = []
+	to_conllu(None, iter_chat(as_lines(chat), final), final, clear_mor, clear_gra, clear_misc, cache, out)
+	return out.getvalue()
+
+
+def index_path(filename: 'pathlib.PosixPath') -> 'pathlib.PosixPath':
+	"""The sidecar index written by to_conllu_delta() next to a CoNLL-U file."""
+	return Path(str(filename) + ".idx")
+
+def read_conllu_index(filename: 'pathlib.PosixPath', flags: List[bool]) -> Dict:
+	"""Load the index of a CoNLL-U file written by to_conllu_delta(), or
+	return None if there is none or it does not describe the file as it is
+	now, with the same flags and tool version.
+	"""
+	from helpers.manifest import tool_version
+	try:
+		with open(index_path(filename), encoding='utf-8') as fp:
+			index = json.load(fp)
+		data = Path(filename).read_bytes()
+	except (OSError, ValueError):
+		return None
+	if (index.get('version') != tool_version() or index.get('flags') != flags
+			or index.get('size') != len(data) or index.get('sha1') != hashlib.sha1(data).hexdigest()):
+		return None
+	return index
+
+def to_conllu_delta(filename: 'pathlib.PosixPath', blocks: Iterable[Tuple[List[str], List[str]]], final: List[str], clear_mor=False, clear_gra=False, clear_misc=False, cache: LRUCache=None, out=None):
+	"""Write the same CoNLL-U file as to_conllu(), converting only the
+	utterances that changed since the file was last written by this
+	function.
+
+	Each sentence block is keyed by the hash of the lines it is written
+	from: its utterance and comments, the empty utterances before it and,
+	for the last one, after it. A sidecar index (see index_path()) maps
+	the keys to the blocks' bytes in the file, and the hashes of utterances
+	to whether they are empty. Blocks found in the index of the previous
+	output are copied from it with only their sent_id renumbered, and
+	utterances are only converted when a block they are written in changed
+	or when it is not known whether they are empty.
+
+	As in to_conllu(), the file can be written to a text stream `out`; it
+	must then be saved to filename as is for the index to be used.
+	"""
+	from helpers.manifest import tool_version
+	flags = [clear_mor, clear_gra, clear_misc]
+	old = read_conllu_index(filename, flags) or {}
+	known = old.get('utterances', {})
+	reuse = old.get('blocks', {})
+	utterances = {}
+	index_blocks = {}
+	header = []
+	final_empty = None  # of the last block, None without utterances
+	pos = 0
+	written = reused = 0
+
+	def convert(idx, utterance):
+		try:
+			return create_sentence(idx, utterance, cache)
+		except IndexError as e:
+			logger.exception(e)
+			logger.info(f"writing sent {utterance} to {filename}...")
+			raise
+
+	def entries():
+		"""(meta, (idx, meta, utterance, sent), empty) for sentence_blocks(),
+		where sent is None unless the utterance had to be converted to know
+		whether it is empty.
+		"""
+		for idx, (meta, utterance) in enumerate(blocks):
+			h = hashlib.sha1(json.dumps(utterance).encode('utf-8')).hexdigest()
+			empty = known.get(h)
+			sent = None
+			if empty is None:
+				sent = convert(idx, utterance)
+				empty = sent.text() in EMPTY
+			utterances[h] = empty
+			yield meta, (idx, [] if idx == 0 else meta, utterance, sent), empty
+
+	def write_block(body, old_fp, item, meta, empty, final_empty):
+		nonlocal pos, written, reused
+		i, _, utterance, sent = item or (-1, [], None, None)
+		key = hashlib.sha1(json.dumps([meta, [e[1:3] for e in empty], utterance, final_empty]).encode('utf-8')).hexdigest()
+		if key in reuse:
+			offset, length = reuse[key]
+			old_fp.seek(old['body'] + offset)
+			text = SENT_ID.sub(f"# sent_id = {i+1}", old_fp.read(length).decode('utf-8'), count=1)
+			reused += 1
+		else:
+			out = StringIO()
+			write_sentence(out,
+						   None if item is None else sent or convert(i, utterance),
+						   meta,
+						   [e[3] or convert(e[0], e[2]) for e in empty],
+						   final_empty,
+						   clear_mor, clear_gra, clear_misc)
+			text = out.getvalue()
+		length = len(text.encode('utf-8'))
+		index_blocks[key] = [pos, length]
+		pos += length
+		written += 1
+		body.write(text)
+
+	with SpooledTemporaryFile(max_size=SPOOL_SIZE, mode='w+', encoding='utf-8') as body:
+		old_fp = open(filename, 'rb') if reuse else None
+		try:
+			for item, meta, empty, final_empty in sentence_blocks(entries(), header, lambda e: e[3] or convert(e[0], e[2])):
+				write_block(body, old_fp, item, meta, empty, final_empty)
+		finally:
+			if old_fp is not None:
+				old_fp.close()
+
+		head = StringIO()
+		for m in header:
+			head.write(f"# {m}\n")
+		if final_empty is not None:  # has utterances
+			head.write(f"# {TIER_ENCODING} = raw\n")
+			head.write(f"# final = {final}\n")
+			head.write(f"# final_sents = {final_empty}\n")
+		head = head.getvalue()
+		digest = hashlib.sha1(head.encode('utf-8'))
+		size = len(head.encode('utf-8'))
+		with open_output(filename, out) as f:
+			f.write(head)
+			body.seek(0)
+			for chunk in iter(lambda: body.read(1 << 16), ''):
+				f.write(chunk)
+				data = chunk.encode('utf-8')
+				digest.update(data)
+				size += len(data)
+
+	with open(index_path(filename), 'w', encoding='utf-8') as fp:
+		json.dump({'version': tool_version(),
+				   'flags': flags,
+				   'size': size,
+				   'sha1': digest.hexdigest(),
+				   'body': len(head.encode('utf-8')),
+				   'utterances': utterances,
+				   'blocks': index_blocks,
+				   }, fp)
+	logger.info(f"{filename}: {reused} of {written} sentence blocks unchanged.")
+
+
+def chat_file2conllu(f: 'pathlib.PosixPath', clear_mor=False, clear_gra=False, clear_misc=False, cache: LRUCache=None, delta=False, text: str=None, out=None, variants: List[Tuple[str, bool, bool, bool]]=None):
+	"""Convert a CHAT file to a CoNLL-U file next to it, with
+	to_conllu_delta() if delta. If the content of f is given as text, it is
+	not read again; if a text stream out is given, the output is written to
+	it rather than next to f.
+
+	If variants (see parse_variant()) are given, the clear_* flags are not
+	used and a file is written for each variant from the same conversion;
+	out is then a list of text streams, one per variant.
+
+	Return the diagnostics of the file (see helpers.diagnostics).
+	"""
+	if variants is None:
+		variants, out = [("", clear_mor, clear_gra, clear_misc)], [out]
+	elif out is None:
+		out = [None] * len(variants)
+	outputs = [(variant_path(f, suffix), tuple(flags), o) for (suffix, *flags), o in zip(variants, out)]
+	from helpers.archive import open_input  # reads members of zip archives as well
+	# ---- parse chat ----
+	logger.info(f"parsing {f}...")
+	diagnostics.begin_file(f)
+	if delta:
+		if text is None:
+			with open_input(f) as fp:
+				text = fp.read()
+		if cache is None and len(outputs) > 1:  # convert each utterance once for all variants
+			cache = LRUCache(sys.maxsize)
+		for k, (fn, flags, o) in enumerate(outputs):
+			final = []
+			if k > 0:  # the diagnostics of the file are those of its first variant
+				diagnostics.capture()
+			try:
+				to_conllu_delta(fn, iter_chat(StringIO(text), final), final, *flags, cache, o)
+			finally:
+				if k > 0:
+					diagnostics.release()
+		return diagnostics.end_file()
+	with open_input(f) if text is None else StringIO(text) as fp:
+		final = []
+		to_conllu_variants(outputs, iter_chat(fp, final), final, cache)
+		# print(all_feats)
+	return diagnostics.end_file()
+
+_worker_cache = None
+
+def _worker_cache_for(cache_size: int) -> LRUCache:
+	"""The cache of the worker process, created on its first file, or None
+	if cache_size is not positive.
+	"""
+	global _worker_cache
+	if _worker_cache is None and cache_size > 0:
+		_worker_cache = LRUCache(cache_size)
+	return _worker_cache
+
+def _chat_file2conllu_worker(f: 'pathlib.PosixPath', clear_mor, clear_gra, clear_misc, cache_size, delta, variants=None):
+	"""chat_file2conllu() in a worker process, with one cache per process."""
+	return chat_file2conllu(f, clear_mor, clear_gra, clear_misc, _worker_cache_for(cache_size), delta, None, None, variants)
+
+def chat_file2conllu_texts(f: 'pathlib.PosixPath', clear_mor=False, clear_gra=False, clear_misc=False, cache: LRUCache=None, delta=False, text: str=None, variants: List[Tuple[str, bool, bool, bool]]=None) -> Tuple[diagnostics.Tally, List[Tuple['pathlib.PosixPath', str]]]:
+	"""chat_file2conllu() into strings: return the diagnostics of the file
+	and the path and text of each output, without writing them.
+	"""
+	outputs = [variant_path(f, suffix) for suffix, *_ in variants or [("",)]]
+	outs = [StringIO() for _ in outputs]
+	tally = chat_file2conllu(f, clear_mor, clear_gra, clear_misc, cache, delta, text, outs[0] if variants is None else outs, variants)
+	return tally, [(fn, out.getvalue()) for fn, out in zip(outputs, outs)]
+
+def _chat_file2conllu_texts_worker(f: 'pathlib.PosixPath', clear_mor, clear_gra, clear_misc, cache_size, delta, variants=None):
+	"""chat_file2conllu_texts() in a worker process, with one cache per process."""
+	return chat_file2conllu_texts(f, clear_mor, clear_gra, clear_misc, _worker_cache_for(cache_size), delta, None, variants)
+
+def chat2conllu(files: List['pathlib.PosixPath'], clear_mor=False, clear_gra=False, clear_misc=False, cache_size=0, jobs=1, manifest: 'helpers.manifest.Manifest'=None, delta=False, pipeline=0, variants: List[Tuple[str, bool, bool, bool]]=None, sink: 'helpers.archive.ArchiveSink'=None):
+	"""Convert CHAT files to CoNLL-U files next to them. If cache_size is
+	positive, the conversions of up to cache_size distinct utterances are
+	cached for the whole run, or per process if jobs > 1, in which case
+	files are converted in a pool of that many processes (see run_jobs()).
+
+	If a manifest is given, files converted before with the same content,
+	flags and tool version are skipped, and the manifest is updated. If
+	delta, only the changed utterances of the other files are converted
+	again (see to_conllu_delta()).
+
+	If pipeline is positive and jobs is 1, files are read ahead and written
+	behind in threads while converting, with queues of that depth (see
+	run_pipeline()).
+
+	If variants (see parse_variant()) are given instead of the clear_*
+	flags, each file is converted once and written in every variant.
+
+	If a sink is given, the outputs are added to it rather than written
+	next to the files, in the order of files (see ArchiveSink).
+	"""
+	if variants is None:
+		flags = {'clear_mor': clear_mor, 'clear_gra': clear_gra, 'clear_misc': clear_misc}
+	else:
+		flags = {'variants': [list(v) for v in variants]}
+
+	def output(f):
+		if variants is None:
+			return f.with_suffix(".conllu")
+		return [variant_path(f, v[0]) for v in variants]
+
+	if sink is not None and (manifest is not None or delta):
+		raise ValueError("outputs written to an archive cannot be skipped or updated in place")
+	keys = {}
+	if manifest is not None:
+		keys = {f: manifest.key(f, flags) for f in files}
+		todo = [f for f in files if not manifest.is_current(f, output(f), keys[f])]
+		logger.info(f"{len(files) - len(todo)} of {len(files)} files are up to date.")
+		files = todo
+	if sink is None:
+		for parent in {variant_path(f, "").parent for f in files}:  # e.g. outputs of files in an archive
+			parent.mkdir(parents=True, exist_ok=True)
+	try:
+		if jobs > 1:
+			from helpers.pool import run_jobs
+		if jobs > 1 and sink is not None:
+			def done(result):
+				tally, outputs = result
+				diagnostics.merge(tally)
+				for fn, text in outputs:
+					sink.add(fn, text)
+
+			tasks = [(f, clear_mor, clear_gra, clear_misc, cache_size, False, variants) for f in files]
+			failed = [task[0] for task in run_jobs(_chat_file2conllu_texts_worker, tasks, jobs, done)]
+			if failed:
+				logger.error(f"{len(failed)} of {len(files)} files could not be converted.")
+		elif jobs > 1:
+			tasks = [(f, clear_mor, clear_gra, clear_misc, cache_size, delta, variants) for f in files]
+			failed = [task[0] for task in run_jobs(_chat_file2conllu_worker, tasks, jobs, diagnostics.merge)]
+			if failed:
+				logger.error(f"{len(failed)} of {len(files)} files could not be converted.")
+			if manifest is not None:
+				for f in files:
+					if f not in failed:
+						manifest.record(f, output(f), keys[f])
+		else:
+			cache = LRUCache(cache_size) if cache_size > 0 else None
+
+			def convert(f, text):
+				tally, outputs = chat_file2conllu_texts(f, clear_mor, clear_gra, clear_misc, cache, delta, text, variants)
+				diagnostics.merge(tally)
+				return outputs
+
+			from helpers.pipeline import run_pipeline, write_text
+
+			def write(f, outputs):
+				for fn, text in outputs:
+					if sink is None:
+						write_text(fn, text)
+					else:
+						sink.add(fn, text)
+				if manifest is not None:
+					manifest.record(f, output(f), keys[f])
+
+			if pipeline > 0:
+				run_pipeline(files, convert, write, pipeline)
+			elif sink is not None:
+				for f in files:
+					write(f, convert(f, None))
+			else:
+				for f in files:
+					diagnostics.merge(chat_file2conllu(f, clear_mor, clear_gra, clear_misc, cache, delta, None, None, variants))
+					if manifest is not None:
+						manifest.record(f, output(f), keys[f])
+			if cache is not None:
+				logger.info(f"utterance cache: {cache}")
+	finally:
+		if manifest is not None:
+			manifest.save()
+		diagnostics.end_run()
 
 if __name__ == "__main__":
 
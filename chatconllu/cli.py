@@ -1,12 +1,47 @@
+import io
+import sys
 import argparse
-import chatparser
-import conlluparser
+from contextlib import ExitStack
 from helpers.utils import list_files
+from helpers.archive import find_archive, output_root, sink_format, SINK_FORMATS, ArchiveSink
+from helpers.manifest import Manifest
 from pathlib import Path
-from logger import logger
+from logger import logger, shell_handler
 import time
 
 
+def parse_variant(name):
+    """chatparser.parse_variant(), importing the converter only when the option is used."""
+    import chatparser
+    return chatparser.parse_variant(name)
+
+
+def stream(args):
+    """Convert stdin to stdout, writing each sentence as soon as it is converted."""
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", line_buffering=False)
+    if args.format == "cha":
+        import chatparser
+        final = []
+        if args.variants:
+            _, args.clear_mor, args.clear_gra, args.clear_misc = args.variants[0]
+        texts = chatparser.iter_conllu_text(chatparser.iter_chat(stdin, final), final, args.clear_mor, args.clear_gra, args.clear_misc)
+    else:
+        import conlluparser
+        texts = conlluparser.iter_conllu2chat(stdin, args.generate_mor, args.generate_gra, args.generate_cnl, args.generate_pos)
+    from helpers import diagnostics
+    diagnostics.begin_file("<stdin>")
+    try:
+        for text in texts:
+            stdout.write(text)
+            stdout.flush()
+    except BrokenPipeError:  # e.g. piped into head
+        sys.stderr.close()
+        return
+    diagnostics.merge(diagnostics.end_file())
+    diagnostics.end_run()
+
+
 def main():
     argp = argparse.ArgumentParser()
     argp.add_argument(
@@ -29,7 +64,7 @@ def main():
     argp.add_argument(
         "corpora",
         nargs="+",
-        help="names of CHILDES corpora if all files within needs conversion")
+        help="names of CHILDES corpora if all files within needs conversion (directories, or zip archives and directories within them, e.g. 'Brown.zip' or 'Brown.zip/Brown/Adam'), or '-' to convert stdin to stdout")
     #---- booleans ----
     argp.add_argument('--mor', dest='clear_mor', action='store_false')
     argp.add_argument('--no-mor', dest='clear_mor', action='store_true')
@@ -55,36 +90,115 @@ def main():
     argp.add_argument('--pos', dest='generate_pos', action='store_true')
     argp.set_defaults(generate_pos=False)
 
+    argp.add_argument(
+        "--cache",
+        type=int,
+        default=0,
+        help="number of distinct utterances whose conversion is cached for the run, 0 disables the cache")
+
+    argp.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes converting files in parallel")
+
+    argp.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip files converted before with the same content, flags and tool version, as recorded in a manifest in each corpus directory")
+
+    argp.add_argument(
+        "--delta",
+        action="store_true",
+        help="only convert the utterances of .cha files that changed since their .conllu output was last written with --delta")
+
+    argp.add_argument(
+        "--pipeline",
+        type=int,
+        default=0,
+        metavar="DEPTH",
+        help="read files ahead and write outputs behind in threads while converting, with queues holding up to DEPTH files; 0 converts files one after another")
+
+    argp.add_argument(
+        "--variant",
+        dest="variants",
+        action="append",
+        type=parse_variant,
+        metavar="NAME",
+        help="write an output variant, 'full' or tiers to clear joined by '+' (e.g. 'no-mor+no-gra') to .<NAME>.conllu files (.conllu for 'full'); may be repeated to parse each file once for all variants, overrides --no-mor, --no-gra and --no-misc")
+
+    argp.add_argument(
+        "-o",
+        "--output-dir",
+        type=str,
+        help="directory the .conllu outputs of files read from zip archives are written to, at their path in the archive; defaults to the directory of the archive")
+
+    argp.add_argument(
+        "--archive",
+        type=str,
+        metavar="PATH",
+        help=f"write all outputs of the run into one archive at PATH ({', '.join(SINK_FORMATS)}), named by their path relative to --directory (to --output-dir for files read from zip archives if given, to the working directory for .cha outputs), instead of one file each")
+
+    argp.add_argument(
+        "--log-level",
+        type=str.upper,
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="least severe messages to log; repeated diagnostics are counted and logged once per file and run, with their first occurrence at DEBUG")
+
     args = argp.parse_args()
+    logger.setLevel(args.log_level)
 
     if args.format != "cha" and args.format != "conllu":
         logger.fatal(f"'{args.format}' is not supported. Supported values for format are 'cha' and 'conllu'")
         return
 
+    if args.archive is not None:
+        if sink_format(args.archive) is None:
+            argp.error(f"--archive must end with one of {', '.join(SINK_FORMATS)}")
+        if args.incremental or args.delta:
+            argp.error("--archive cannot be used with --incremental or --delta")
+
+    if args.corpora == ["-"]:
+        if args.variants and len(args.variants) > 1:
+            argp.error("only one --variant can be written to stdout")
+        shell_handler.stderr = True  # stdout is the output
+        stream(args)
+        return
+
     start_time = time.time()
-    for c in args.corpora:
-        directory = Path(args.directory, c)
-        if not directory.exists():
-            logger.fatal(f"The directory you specified does not exist.\nPlease recheck if you entered the path correctly: '{directory}'")
-            return
-
-        files = []
-        if args.filename:
-            files = list_files(directory, args.format, args.filename)
-        else:
-            files = list_files(directory, args.format)
-        if not files:
-            logger.fatal(f"No files with extension '{args.format}' are found within {Path(args.directory, c)}.")
-            return
-
-        # logger.info(f"Listing all .{args.format} files in {directory}...")
-        # for f in files:
-        #   logger.info(f"\t{f}")
-
-        if args.format == "cha":
-            chatparser.chat2conllu(files, args.clear_mor, args.clear_gra, args.clear_misc)
-        elif args.format == "conllu":
-            conlluparser.conllu2chat(files, args.generate_mor, args.generate_gra, args.generate_cnl, args.generate_pos)
+    with ExitStack() as stack:
+        sink = stack.enter_context(ArchiveSink(args.archive)) if args.archive else None
+        for c in args.corpora:
+            directory = Path(args.directory, c)
+            if not directory.exists() and find_archive(directory)[0] is None:
+                logger.fatal(f"The directory you specified does not exist.\nPlease recheck if you entered the path correctly: '{directory}'")
+                return
+
+            files = []
+            if args.filename:
+                files = list_files(directory, args.format, args.filename, args.output_dir)
+            else:
+                files = list_files(directory, args.format, out_dir=args.output_dir)
+            if not files:
+                logger.fatal(f"No files with extension '{args.format}' are found within {Path(args.directory, c)}.")
+                return
+
+            # logger.info(f"Listing all .{args.format} files in {directory}...")
+            # for f in files:
+            #   logger.info(f"\t{f}")
+
+            manifest = Manifest(output_root(directory, args.output_dir)) if args.incremental else None
+            if args.format == "cha":
+                import chatparser  # only the converter for the direction asked for is imported
+                if sink is not None:
+                    in_archive = find_archive(directory)[0] is not None
+                    sink.root = Path(args.output_dir if in_archive and args.output_dir else args.directory)
+                chatparser.chat2conllu(files, args.clear_mor, args.clear_gra, args.clear_misc, args.cache, args.jobs, manifest, args.delta, args.pipeline, args.variants, sink)
+            elif args.format == "conllu":
+                import conlluparser
+                conlluparser.conllu2chat(files, args.generate_mor, args.generate_gra, args.generate_cnl, args.generate_pos, args.jobs, manifest, args.pipeline, sink)
     end_time = time.time()
     logger.info(f"It took {end_time-start_time:.2f} secods.")
 
@@ -3,17 +3,20 @@
 import sys, os
 import re
 import ast
-from typing import List, Tuple, Dict, Union
+from typing import List, Tuple, Dict, Union, Iterable, Iterator
 from pathlib import Path
+from collections import OrderedDict
+from contextlib import nullcontext
+from io import StringIO
 
 from logger import logger
 from helpers.sentence import Sentence
 from helpers.token import Token
+from helpers import diagnostics
+from helpers.conllu import ConlluSentence, iter_conllu, iter_conllu_file, TIER_ENCODING, decode_tier
+from helpers.utils import as_lines
 
-import pyconll
-
-_OUT_DIR = Path('tests', 'out')
-_OUT_DIR.mkdir(parents=True, exist_ok=True)
+_OUT_DIR = Path('tests', 'out')  # created when a file is written to it
 PUNCT = re.compile("([,.;?!:”])")
 STANDARD = [  # names to ignore
 	'sent_id',
@@ -27,7 +30,8 @@ STANDARD = [  # names to ignore
 	'empty_speaker',
 	'empty_chat_sent',
 	'final_sents',
-	'final_comments'
+	'final_comments',
+	TIER_ENCODING,
 	]
 CHAT_PUNCT = [
 	'„',
@@ -39,305 +43,341 @@ CHAT_PUNCT = [
 	'’',
 	]
 
-def construct_mwe(sentence, tier):
-	# -------- construct tier for multi-word tokens--------
-	mwt = [sentence[k] for k in tier.keys() if '-' in k]
-	for k in mwt:
-		if 'type' in k.misc.keys():
-			start, _, end = k.id.partition('-')
-			# type = next(iter(k.misc['type']))
-			type = list(k.misc['type'])[0].split('^')[0]
-			p = type.join(tier.pop(str(n)) for n in range(int(start), int(end) + 1))
-		else:  # use arbitrary symbol '~'
-			p = '~'.join(tier.pop(str(n)) for n in range(int(start), int(end) + 1))
-		tier[k.id] = p
-	return tier
-
-def construct_gra_cnl(sentence, is_cnl=False):
-	token_count = 0
-	gra = []
-	for i, word in enumerate(sentence):
-		g = ''
-		if '-' in word.id:
-			continue
-		elif not is_cnl:
-			deprel = 'None'
-			token_count += 1
-			head = 'None'
-			g = f'{token_count}|{head}|{deprel}'
-			g = g.replace('None', '_')
+def has_tiers(sentence) -> Tuple[bool, bool]:
+	"""Whether %mor and %gra can be reconstructed from the sentence: from its
+	first word (the second token after a multi-word token) if it has tokens,
+	else from its comments.
+	"""
+	if not sentence.tokens:
+		return 'mor' in sentence.meta, 'gra' in sentence.meta
+	t = sentence.tokens[0]
+	if t.is_multiword():
+		t = sentence.tokens[1]
+	return t.lemma is not None, t.head is not None
+
+def _mor(word, has_gra):
+	"""The %mor item of a word from its XPOS, LEMMA and MISC."""
+	misc = word.misc
+	m = ''
+	if 'components' in misc:  # compound
+		for v in misc['components']:
+			m = '|'.join([word.xpos, '+' + v.replace('@', '|').replace('^', '+')])  # reverse to MOR coding
+	elif word.lemma and (word.xpos or not has_gra) and word.xpos != 'punct' and not word.form in CHAT_PUNCT:
+		m = '|'.join([word.xpos, word.lemma])
+		if 'feats' in misc:
+			for f in misc['feats']:
+				m += f.replace('^', '')
+		if 'translation' in misc:
+			for t in misc['translation']:
+				m += '=' + t
+	if word.lemma and len(word.lemma) == 1 and PUNCT.match(word.lemma) and not word.form in CHAT_PUNCT:  # punctuation's mor is form
+		m = word.lemma
+	if 'form' in misc:
+		if has_gra:
+			m = misc['form'][-1].replace('@', '|')
 		else:
-			deprel = word.deprel if word.deprel else 'None'
-			token_count += 1
-			head = word.head if word.head else 'None'
-			g = f'{token_count}|{head}|{deprel}'
-		gra.append(g)
-	return gra
-
-def construct_mor_pos(sentence, is_pos=False):
-	mor = {}
-	for i, word in enumerate(sentence):
-		m = ''
-		if not '-' in word.id:
-			if not is_pos:
-				if word.lemma and re.match(PUNCT, word.lemma) and len(word.lemma)==1:  # punctuation's mor is form
-					m = word.lemma
-				else:
-					upos = 'None'
-					lemma = 'None'
-					m = f'{upos}|{lemma}'
-					m = m.replace('None', '_')
-			else:
-				upos = word.upos.lower() if word.upos else 'None'
-				lemma = word.lemma if word.lemma else 'None'
-				m = f'{upos}|{lemma}'
-		mor[word.id] = m
-	return mor
-
-def construct_tiers(sentence, has_mor, has_gra, generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False):
-	mor = {}
+			for f in misc['form']:
+				m += f.replace('@', '|')
+	if 'prefix' in misc:
+		for p in misc['prefix']:
+			m = p + "#" + m
+	return m
+
+def construct_tiers(sentence, has_mor, has_gra, generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False) -> Tuple[List[str], List[str], List[str], List[str]]:
+	"""The items of the %mor, %gra, %cnl and %pos tiers of a sentence, built
+	in a single pass over its tokens. %mor and %gra are reconstructed from
+	the sentence if has_mor and has_gra, or generated empty instead; %cnl
+	and %pos are generated from HEAD/DEPREL and UPOS/LEMMA. Tiers that are
+	neither reconstructed nor generated are empty lists.
+	"""
+	do_mor = has_mor or generate_mor
+	do_gra = has_gra or generate_gra
+	mor = []
 	gra = []
 	cnl = []
-	pos = {}
-	token_count = 0
-	cnl_count = 0
-	if has_mor and has_gra:
-		for i, word in enumerate(sentence):
-			m = ''
-			g = ''
-			# -------- reconstruct %mor --------
-			if 'components' in word.misc.keys():  #compound
-				for v in word.misc['components']:
-					tmp = '+' + v.replace('@', '|').replace('^', '+')  # reverse to MOR coding
-					m = '|'.join([word.xpos, tmp])
-			elif word.lemma and word.xpos and word.xpos != 'punct' and not word.form in CHAT_PUNCT:
-				m = '|'.join([word.xpos, word.lemma])
-				if 'feats' in word.misc.keys():
-					for f in word.misc['feats']:
-						tmp = f.replace('^', '')
-						m += tmp
-				if 'translation' in word.misc.keys():
-					for t in word.misc['translation']:
-						m += '=' + t
-			if word.lemma and re.match(PUNCT, word.lemma) and len(word.lemma)==1 and not word.form in CHAT_PUNCT:  # punctuation's mor is form
-				m = word.lemma
-			if 'form' in word.misc.keys():
-				# print("has key1")
-				for f in word.misc['form']:
-					# print(f)
-					m = f.replace('@', '|')
-					# print(m)
-			if 'prefix' in word.misc.keys():
-				for p in word.misc['prefix']:
-					m  = p + "#" + m
-			mor[word.id] = m
-			# -------- reconstruct %gra --------
-			if '-' in word.id:
-				continue
-			else:
-				if 'gr' in word.misc.keys():
-					deprel = word.misc['gr'].pop()
-				else:
-					deprel = 'None'
-				token_count += 1
-				if 'head' in word.misc.keys():
-					for h in word.misc['head']:
-						head = h
-				else:
-					head = word.head if word.head else 'None'
-				g = f'{token_count}|{head}|{deprel.upper()}'
-				g = g.replace('None', '_')
-				gra.append(g)
-		# -------- reconstruct %mor for multi-word tokens--------
-		construct_mwe(sentence, mor)
-	elif has_mor:
-		for i, word in enumerate(sentence):
-			m = ''
-			# -------- reconstruct %mor --------
-			if 'components' in word.misc.keys():
-				for v in word.misc['components']:
-					tmp = '+' + v.replace('@', '|').replace('^', '+')
-					m = '|'.join([word.xpos, tmp])
-			elif word.lemma and word.xpos != 'punct' and not word.form in CHAT_PUNCT:
-				m = '|'.join([word.xpos, word.lemma])
-				if 'feats' in word.misc.keys():
-					for f in word.misc['feats']:
-						tmp = f.replace('^', '')
-						m += tmp
-				if 'translation' in word.misc.keys():
-					for t in word.misc['translation']:
-						m += '=' + t
-			if word.lemma and re.match(PUNCT, word.lemma) and len(word.lemma)==1 and not word.form in CHAT_PUNCT:  # punctuations mor is form
-				m = word.lemma
-			if 'form' in word.misc.keys():
-				# print("has key2")
-				for f in word.misc['form']:
-					# print(f)
-					m += f.replace('@', '|')
-					# print(m)
-			if 'prefix' in word.misc.keys():
-				for p in word.misc['prefix']:
-					m  = p + "#" + m
-				# m = f"{word.misc['prefix'][0]}#{m}"
-			mor[word.id] = m
-		# -------- reconstruct %mor for multi-word tokens--------
-		construct_mwe(sentence, mor)
-	elif has_gra:
-		for i, word in enumerate(sentence):
-			g = ''
-			# -------- reconstruct %gra --------
-			if '-' in word.id:
-				continue
+	pos = []
+	count = 0
+	left = 0  # words of the current multi-word token still to read
+	for word in sentence:
+		if word.is_multiword():
+			start, _, end = word.id.partition('-')
+			left = int(end) - int(start) + 1
+			sep = word.misc['type'][0].split('^')[0] if word.misc.get('type') else '~'  # or arbitrary symbol '~'
+			mwt_mor = []
+			mwt_pos = []
+			at_mor = len(mor)
+			at_pos = len(pos)
+			if do_mor:
+				mor.append('')
+			if generate_pos:
+				pos.append('')
+			continue
+		count += 1
+		# -------- %mor and %pos --------
+		if generate_mor:
+			lemma = word.lemma
+			m = lemma if lemma and len(lemma) == 1 and PUNCT.match(lemma) else '_|_'  # punctuation's mor is form
+		elif has_mor:
+			m = _mor(word, has_gra)
+		if generate_pos:
+			p = f"{word.upos.lower() if word.upos else 'None'}|{word.lemma if word.lemma else 'None'}"
+		if left:  # a word of a multi-word token
+			if do_mor:
+				mwt_mor.append(m)
+				mor[at_mor] = sep.join(mwt_mor)
+			if generate_pos:
+				mwt_pos.append(p)
+				pos[at_pos] = sep.join(mwt_pos)
+			left -= 1
+		else:
+			if do_mor:
+				mor.append(m)
+			if generate_pos:
+				pos.append(p)
+		# -------- %gra and %cnl --------
+		if generate_gra:
+			gra.append(f'{count}|_|_')
+		elif has_gra:
+			misc = word.misc
+			deprel = misc['gr'][-1].upper() if 'gr' in misc else 'NONE'
+			if 'head' in misc:
+				head = misc['head'][-1]
 			else:
-				if 'gr' in word.misc.keys():
-					deprel = word.misc['gr'].pop()
-				else:
-					deprel = 'None'
-				token_count += 1
-				if 'head' in word.misc.keys():
-					for h in word.misc['head']:
-						head = h
-				else:
-					head = word.head
-				g = f'{token_count}|{head}|{deprel.upper()}'
-				gra.append(g)
-	if generate_cnl:
-		cnl = construct_gra_cnl(sentence, generate_cnl)
-	if generate_gra:  # construct empty %gra
-		gra = construct_gra_cnl(sentence)
-	if generate_pos:
-		pos = construct_mor_pos(sentence, generate_pos)
-		# -------- construct %pos for multi-word tokens--------
-		construct_mwe(sentence, pos)
-	if generate_mor:  # construct empty %mor
-		mor = construct_mor_pos(sentence)
-		# -------- reconstruct %mor for multi-word tokens--------
-		construct_mwe(sentence, mor)
-
+				head = word.head if word.head or not has_mor else 'None'
+			g = f'{count}|{head}|{deprel}'
+			gra.append(g.replace('None', '_') if has_mor else g)
+		if generate_cnl:
+			cnl.append(f"{count}|{word.head if word.head else 'None'}|{word.deprel if word.deprel else 'None'}")
 	return mor, gra, cnl, pos
 
-def process_final_sents(meta_key: str, sentence):
+def tier_text(value: str, raw=False) -> str:
+	"""The text of a dependent tier stored in a comment, as written by
+	encode_tier() if raw, or as a list repr by earlier versions.
+	"""
+	return decode_tier(value) if raw else ' '.join(ast.literal_eval(value))
+
+def process_final_sents(meta_key: str, value: str, raw=False):
 	if meta_key.startswith("final_") and meta_key not in STANDARD:
 		name = meta_key.replace("final_", '')[:-2]
-		print(name)
 		if len(name)==3 and name.islower():
-			val = ' '.join(ast.literal_eval(sentence.meta_value(meta_key)))
+			val = tier_text(value, raw)
 			return f"%{name}:\t{val}\n"
 		elif name.isupper():
-			return f"*{name}:\t{sentence.meta_value(meta_key)}\n"
+			return f"*{name}:\t{value}\n"
 	if meta_key.endswith("comments"):
-		return f"{sentence.meta_value(meta_key)}\n"
+		return f"{value}\n"
 
-def to_cha(outfile, conll: 'pyconll.Conll', generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False):
+def iter_cha(conll: Iterable[ConlluSentence], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False) -> Iterator[str]:
+	"""Lazily yield the CHAT text of each sentence of conll, then the final
+	lines of the file.
+	"""
 	final = []
+	raw = False
 	for sentence in conll:
-		mor = {}
-		gra = []
-		has_mor = False
-		has_gra = False
-
-		if 'chat_sent' in sentence._meta.keys():
-			# ---- write headers ----
-			for k in sentence._meta.keys():
-				if k.startswith('@'):
-					outfile.write(f"{k}\n")
+		lines = []
+		meta = sentence.meta
+		diagnostics.at(sentence.id)
+		if TIER_ENCODING in meta:  # in the headers of the file
+			raw = meta[TIER_ENCODING] == 'raw'
+
+		# ---- sort the comments in one pass ----
+		headers = []
+		empty_tiers = []
+		tiers = []
+		finals = []
+		for k, v in meta.items():
+			if k.startswith('@'):
+				headers.append(k)
+			elif '\t' not in k and k not in STANDARD:
+				if k.startswith('empty_'):
+					empty_tiers.append((k.partition('_')[2], v))
+				elif not k.startswith('final_'):
+					tiers.append((k, v))
+			s = process_final_sents(k, v, raw)
+			if s:
+				finals.append(s)
+
+		# ---- write headers ----
+		for k in headers:
+			lines.append(f"{k}\n")
+		if 'chat_sent' in meta:
 			# ---- empty sentences (utterances) ----
-			if 'empty_chat_sent' in sentence._meta.keys():
-				outfile.write(f"*{sentence.meta_value('empty_speaker')}:\t{sentence.meta_value('empty_chat_sent')}\n")
-				for k in sentence._meta.keys():
-					if k.startswith('empty_') and k not in STANDARD and '\t' not in k:
-						_, _, tier = k.partition('_')
-						val = ' '.join(ast.literal_eval(sentence.meta_value(k)))
-						outfile.write(f"%{tier}:\t{val}\n")
+			if 'empty_chat_sent' in meta:
+				lines.append(f"*{meta['empty_speaker']}:\t{meta['empty_chat_sent']}\n")
+				for tier, v in empty_tiers:
+					val = tier_text(v, raw)
+					lines.append(f"%{tier}:\t{val}\n")
 			# ---- sentences (utterances) ----
-			outfile.write(f"*{sentence.meta_value('speaker')}:\t{sentence.meta_value('chat_sent')}\n")
-			# logger.info(f"*{sentence.meta_value('speaker')}:\t{sentence.meta_value('chat_sent')}\n")
-			# ----- check if mor and gra tier are present ----
-			if 'mor' in sentence._meta.keys(): has_mor = True
-			if 'gra' in sentence._meta.keys(): has_gra = True
-			# check the first token for each sentence (or the second for multiword tokens)
-			if sentence._tokens:
-				t = sentence._tokens[0]
-				if t.is_multiword():
-					# logger.debug(f"{t.form} is a multi-word token.")
-					t = sentence._tokens[1]
-				if t.lemma is not None:
-					has_mor = True
-				else: has_mor = False
-				if t.head is not None: has_gra = True
-				else: has_gra = False
-			else:  # sentence is empty?
-				logger.warning(f"sent {sentence.id} has no tokens, check if it's well-formed.")  # utterances like `xxx .` are still recoverable.
+			lines.append(f"*{meta['speaker']}:\t{meta['chat_sent']}\n")
+			has_mor, has_gra = has_tiers(sentence)
+			if not sentence.tokens:  # sentence is empty?
+				diagnostics.note('no_tokens')  # utterances like `xxx .` are still recoverable.
 
 			mor, gra, cnl, pos = construct_tiers(sentence, has_mor, has_gra, generate_mor, generate_gra, generate_cnl, generate_pos)
-			# logger.debug(263)
 			if mor:
-				outfile.write(f"%mor:\t{' '.join(list(mor.values()))}\n")
-				# outfile.write(f"%MOR:\t{' '.join(ast.literal_eval(sentence.meta_value('mor')))}\n")  # for easy comparison
-				# outfile.write('\n')  # easy on the eye
-			# logger.debug(268)
+				lines.append(f"%mor:\t{' '.join(mor)}\n")
 			if gra:
-				outfile.write(f"%gra:\t{' '.join(gra)}\n")
-			# logger.debug(271)
-				# outfile.write(f"%GRA:\t{' '.join(ast.literal_eval(sentence.meta_value('gra')))}\n")  # for easy comparison
-				# outfile.write('\n')  # easy on the eye
-				# logger.debug(list(mor.values()))
-			# if 'mor' in sentence._meta.keys():
-				# logger.info(sc)
-				# logger.debug(len(list(mor.values())))
-				# logger.debug(len(ast.literal_eval(sentence.meta_value('mor'))))
-				# logger.debug(list(mor.values()))
-				# logger.debug(ast.literal_eval(sentence.meta_value('mor')))
-				# assert len(list(mor.values())) == len(ast.literal_eval(sentence.meta_value('mor')))
-				# assert ' '.join(list(mor.values())) == ' '.join(ast.literal_eval(sentence.meta_value('mor')))
-			# if 'gra' in sentence._meta.keys():
-				# logger.info(sc)
-				# logger.debug(len(gra))
-				# logger.debug(len(ast.literal_eval(sentence.meta_value('gra'))))
-				# logger.debug(gra)
-				# logger.debug(ast.literal_eval(sentence.meta_value('gra')))
-				# assert len(gra) == len(ast.literal_eval(sentence.meta_value('gra')))
-				# assert ' '.join(gra) == ' '.join(ast.literal_eval(sentence.meta_value('gra')))
+				lines.append(f"%gra:\t{' '.join(gra)}\n")
 			if cnl:
-				outfile.write(f"%cnl:\t{' '.join(cnl)}\n")
+				lines.append(f"%cnl:\t{' '.join(cnl)}\n")
 			if pos:
-				outfile.write(f"%pos:\t{' '.join(list(pos.values()))}\n")
+				lines.append(f"%pos:\t{' '.join(pos)}\n")
 		else:  # no utterance '0 .'
-			logger.warning(f"sent {sentence.id} has no utterance.")
-		for k in sentence._meta.keys():
-			if not k.startswith('@') and not k.startswith('empty_') and not k.startswith('final_') and k not in STANDARD and '\t' not in k:
-				try:
-					val = ' '.join(ast.literal_eval(sentence.meta_value(k)))
-					outfile.write(f"%{k}:\t{val}\n")
-				except SyntaxError:
-					continue
-				except ValueError:
-					continue
-		for k in sentence._meta.keys():
-			s = process_final_sents(k, sentence)
-			if s:
-				outfile.write(s)
-		if 'final' in sentence._meta.keys():
-			final = ast.literal_eval(sentence.meta_value('final'))
+			diagnostics.note('no_utterance')
+		for k, v in tiers:
+			try:
+				val = tier_text(v, raw)
+				lines.append(f"%{k}:\t{val}\n")
+			except SyntaxError:
+				continue
+			except ValueError:
+				continue
+		lines.extend(finals)
+		if lines:
+			yield "".join(lines)
+		if 'final' in meta:
+			final = ast.literal_eval(meta['final'])
 	if final:
-		for fc in final:
-			outfile.write(f"{fc}\n")
-	# outfile.write("@End")
-	# logger.info(f"{f.stem + f.suffix} has {sc} sentences, {wc} tokens.")
-	# fn = f.with_suffix(".cha")
-	# quit()
+		yield "".join(f"{fc}\n" for fc in final)
 
+def to_cha(outfile, conll: Iterable[ConlluSentence], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False):
+	"""Write the CHAT text of conll to outfile as it is read."""
+	for text in iter_cha(conll, generate_mor, generate_gra, generate_cnl, generate_pos):
+		outfile.write(text)
 
-def conllu2chat(files: List['pathlib.PosixPath'], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False):
+
+def iter_conllu2chat(conllu: Union[str, Iterable[str]], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False) -> Iterator[str]:
+	"""Lazily convert CoNLL-U text, or an iterable of its lines, to CHAT
+	text, yielded sentence by sentence as it is read.
+	"""
+	return iter_cha(iter_conllu(as_lines(conllu)), generate_mor, generate_gra, generate_cnl, generate_pos)
+
+def conllu2chat_text(conllu: Union[str, Iterable[str]], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False) -> str:
+	"""Convert CoNLL-U text, or an iterable of its lines, to CHAT text as
+	conllu_file2chat() would write it, without touching the file system.
+	"""
+	return "".join(iter_conllu2chat(conllu, generate_mor, generate_gra, generate_cnl, generate_pos))
+
+
+def out_path(f: 'pathlib.PosixPath') -> 'pathlib.PosixPath':
+	"""The CHAT file a CoNLL-U file is converted to."""
+	return Path(_OUT_DIR, f.stem + "_pyconll" + ".cha")
+
+
+def conllu_file2chat(f: 'pathlib.PosixPath', generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False, text: str=None, out=None):
+	"""Convert a CoNLL-U file to a CHAT file in _OUT_DIR. If the content of
+	f is given as text, it is not read again; if a text stream out is
+	given, the output is written to it instead.
+
+	Return the diagnostics of the file (see helpers.diagnostics).
+	"""
+	# ---- load conllu file ----
+	logger.info(f"Loading {f}...")
+	diagnostics.begin_file(f)
+	conll = iter_conllu_file(f) if text is None else iter_conllu(as_lines(text))
+	fn = out_path(f)
+	if out is None:
+		logger.debug(f"writing {fn}...")
+		_OUT_DIR.mkdir(parents=True, exist_ok=True)
+	with open(fn, 'w', encoding='utf-8') if out is None else nullcontext(out) as ff:
+		to_cha(ff, conll, generate_mor, generate_gra, generate_cnl, generate_pos)
+	return diagnostics.end_file()
+
+
+def conllu_files2chat(files: List['pathlib.PosixPath'], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False):
+	tally = diagnostics.Tally()
+	for f in files:
+		tally.update(conllu_file2chat(f, generate_mor, generate_gra, generate_cnl, generate_pos))
+	return tally
+
+
+def conllu_files2chat_texts(files: List['pathlib.PosixPath'], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False) -> Tuple[diagnostics.Tally, List[Tuple['pathlib.PosixPath', str]]]:
+	"""conllu_files2chat() into strings: return the diagnostics of the files
+	and the path and text of each output, without writing them.
+	"""
+	tally = diagnostics.Tally()
+	outputs = []
 	for f in files:
-		# if f.with_suffix(".cha").is_file():
-		#   continue
-
-		# ---- load conllu file ----
-		logger.info(f"Loading {f} with pyconll...")
-		conll = pyconll.iter_from_file(f)
-		print(f.stem, _OUT_DIR)
-		fn = Path(_OUT_DIR, f.stem + "_pyconll" + ".cha")
-		print(fn)
-		with open(fn, 'w', encoding='utf-8') as ff:
-			to_cha(ff, conll, generate_mor, generate_gra, generate_cnl, generate_pos)
+		out = StringIO()
+		tally.update(conllu_file2chat(f, generate_mor, generate_gra, generate_cnl, generate_pos, None, out))
+		outputs.append((out_path(f), out.getvalue()))
+	return tally, outputs
+
+
+def conllu2chat(files: List['pathlib.PosixPath'], generate_mor=False, generate_gra=False, generate_cnl=False, generate_pos=False, jobs=1, manifest: 'helpers.manifest.Manifest'=None, pipeline=0, sink: 'helpers.archive.ArchiveSink'=None):
+	"""Convert CoNLL-U files to CHAT files in _OUT_DIR, in a pool of
+	processes if jobs > 1 (see run_jobs()).
+
+	If a manifest is given, files converted before with the same content,
+	flags and tool version are skipped, and the manifest is updated.
+
+	If pipeline is positive and jobs is 1, files are read ahead and written
+	behind in threads while converting, with queues of that depth (see
+	run_pipeline()).
+
+	If a sink is given, the outputs are added to it rather than written to
+	_OUT_DIR, in the order of files (see ArchiveSink).
+	"""
+	if sink is not None and manifest is not None:
+		raise ValueError("outputs written to an archive cannot be skipped")
+	if jobs <= 1 and manifest is None and pipeline <= 0 and sink is None:
+		diagnostics.merge(conllu_files2chat(files, generate_mor, generate_gra, generate_cnl, generate_pos))
+		diagnostics.end_run()
+		return
+	from helpers.pool import run_jobs
+	from helpers.pipeline import run_pipeline, write_text
+	# files with the same name are written to the same output, they are
+	# converted in order in one task so that the last one wins as in a
+	# sequential run
+	groups = OrderedDict()
+	for f in files:
+		groups.setdefault(f.stem, []).append(f)
+	groups = list(groups.values())
+	keys = {}
+	if manifest is not None:
+		flags = {'generate_mor': generate_mor, 'generate_gra': generate_gra,
+				 'generate_cnl': generate_cnl, 'generate_pos': generate_pos}
+		keys = {f: manifest.key(f, flags) for f in files}
+		groups = [g for g in groups if not all(manifest.is_current(f, out_path(f), keys[f]) for f in g)]
+		logger.info(f"{len(files) - sum(len(g) for g in groups)} of {len(files)} files are up to date.")
+	tasks = [(group, generate_mor, generate_gra, generate_cnl, generate_pos) for group in groups]
+	try:
+		if jobs <= 1 and pipeline > 0:
+			def convert(f, text):
+				out = StringIO()
+				diagnostics.merge(conllu_file2chat(f, generate_mor, generate_gra, generate_cnl, generate_pos, text, out))
+				return out.getvalue()
+
+			def write(f, text):
+				if sink is None:
+					write_text(out_path(f), text)
+				else:
+					sink.add(out_path(f), text)
+				if manifest is not None:
+					manifest.record(f, out_path(f), keys[f])
+
+			if sink is None:
+				_OUT_DIR.mkdir(parents=True, exist_ok=True)
+			run_pipeline([f for group in groups for f in group], convert, write, pipeline)
+			return
+		if sink is not None:
+			def done(result):
+				tally, outputs = result
+				diagnostics.merge(tally)
+				for fn, text in outputs:
+					sink.add(fn, text)
+
+			failed = run_jobs(conllu_files2chat_texts, tasks, jobs, done)
+		else:
+			failed = run_jobs(conllu_files2chat, tasks, jobs, diagnostics.merge)
+		if failed:
+			logger.error(f"{len(failed)} of {len(tasks)} conversions could not be completed.")
+		if manifest is not None:
+			for task in tasks:
+				if task not in failed:
+					for f in task[0]:
+						manifest.record(f, out_path(f), keys[f])
+	finally:
+		if manifest is not None:
+			manifest.save()
+		diagnostics.end_run()
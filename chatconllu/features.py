@@ -1,5 +1,6 @@
 import re
 from logger import logger
+from helpers import diagnostics
 
 WELLS = {
 	'-AGT',
@@ -319,6 +320,7 @@ MOR2FEATS = {
 	'aug':'',
 }
 
+@diagnostics.memoize(4096)
 def mor2feats(mor_code: str) -> str:
 	"""If the given mor_code is in the predefined MOR2FEATS dict, return the
 	corresponding upos, otherwise return mor_code.
@@ -329,7 +331,7 @@ def mor2feats(mor_code: str) -> str:
 	m = re.sub("^[&|-]", "", mor_code).lower()
 
 	if not m in MOR2FEATS:
-		logger.warning(f"{mor_code} does not have a corresponding UD feature in MOR2FEATS.")
+		diagnostics.note('feats', mor_code)
 
 	return MOR2FEATS[m] if m in MOR2FEATS else ''
 
@@ -0,0 +1,242 @@
+"""
+Read corpora straight from zip archives, as CHILDES distributes them,
+without extracting them. The files of an archive are listed as ZipMember
+objects, which stand in for their paths: they are opened with
+open_input() and their outputs are written to a directory on disk, at
+their path in the archive.
+
+The outputs of a run can also be written into a single tar or zip archive
+with an ArchiveSink, rather than as one file each.
+"""
+import io
+import os
+import time
+import warnings
+from types import SimpleNamespace
+from pathlib import Path, PurePosixPath
+
+from logger import logger
+
+# the tar mode of each archive suffix a sink can write, None for zip
+SINK_FORMATS = {'.zip': None,
+				'.tar': 'w|',
+				'.tar.gz': 'w|gz',
+				'.tgz': 'w|gz',
+				'.tar.bz2': 'w|bz2',
+				'.tar.xz': 'w|xz',
+				}
+
+_archives = {}  # (archive, pid) -> zipfile.ZipFile, not shared with forked workers
+
+
+def _zipfile(archive):
+	key = (archive, os.getpid())
+	zf = _archives.get(key)
+	if zf is None:
+		import zipfile  # only paid for at startup when reading an archive
+		zf = _archives[key] = zipfile.ZipFile(archive)
+	return zf
+
+
+class ZipMember(object):
+	"""A file in a zip archive, with the parts of the pathlib.Path interface
+	used for inputs. with_suffix() gives paths under out_dir.
+	"""
+
+	__slots__ = ['archive',
+				 'member',
+				 'out_dir',
+				 ]
+
+	def __init__(self, archive, member, out_dir):
+		self.archive = str(archive)
+		self.member = member
+		self.out_dir = str(out_dir)
+
+	@property
+	def name(self):
+		return PurePosixPath(self.member).name
+
+	@property
+	def stem(self):
+		return PurePosixPath(self.member).stem
+
+	@property
+	def suffix(self):
+		return PurePosixPath(self.member).suffix
+
+	def with_suffix(self, suffix):
+		"""The output path of the member with suffix, under out_dir."""
+		return Path(self.out_dir, self.member).with_suffix(suffix)
+
+	def open(self, mode='r', encoding='utf-8'):
+		fp = _zipfile(self.archive).open(self.member)
+		return fp if 'b' in mode else io.TextIOWrapper(fp, encoding=encoding)
+
+	def stat(self):
+		"""The size and modification time of the member, as in os.stat()."""
+		info = _zipfile(self.archive).getinfo(self.member)
+		return SimpleNamespace(st_size=info.file_size, st_mtime_ns=int(time.mktime(info.date_time + (0, 0, -1))) * 10**9)
+
+	def __eq__(self, other):
+		return isinstance(other, ZipMember) and (self.archive, self.member) == (other.archive, other.member)
+
+	def __hash__(self):
+		return hash((self.archive, self.member))
+
+	def __str__(self):
+		return f"{self.archive}/{self.member}"
+
+	def __repr__(self):
+		return f"ZipMember({self.archive!r}, {self.member!r})"
+
+
+def open_input(f, mode='r'):
+	"""Open an input file, on disk or in an archive, for reading text
+	(as UTF-8) or bytes.
+	"""
+	if isinstance(f, ZipMember):
+		return f.open(mode)
+	return open(f, mode) if 'b' in mode else open(f, mode, encoding='utf-8')
+
+
+def find_archive(directory):
+	"""The zip archive holding directory and the directory's path in it, or
+	(None, None) if directory is on disk.
+	"""
+	directory = Path(directory)
+	if directory.is_dir():
+		return None, None
+	for parent in [directory, *directory.parents]:
+		if parent.suffix == '.zip' and parent.is_file():
+			inner = directory.relative_to(parent).as_posix()
+			return parent, "" if inner == "." else inner
+	return None, None
+
+
+def output_root(directory, out_dir=None):
+	"""The directory outputs of files listed in directory are written
+	under: the directory itself, or for an archive out_dir, by default the
+	directory of the archive.
+	"""
+	archive, _ = find_archive(directory)
+	if archive is None:
+		return Path(directory)
+	return Path(out_dir) if out_dir is not None else archive.parent
+
+
+def list_members(archive, inner, format="cha", filename="", out_dir=None):
+	"""The files of archive under the directory inner that end with
+	`<filename>.<format>`, as ZipMember objects whose outputs go under
+	out_dir (by default the directory of the archive). macOS metadata
+	(`__MACOSX/`, `._*`) is skipped, as in directories on disk.
+	"""
+	out_dir = Path(out_dir) if out_dir is not None else Path(archive).parent
+	prefix = inner.rstrip('/') + '/' if inner else ''
+	ending = f"{filename}.{format}"
+	members = []
+	for name in _zipfile(str(archive)).namelist():
+		base = PurePosixPath(name).name
+		if (name.startswith(prefix) and base.endswith(ending) and not base.startswith("._")
+				and not name.startswith("__MACOSX/")):
+			members.append(ZipMember(archive, name, out_dir))
+	return members
+
+
+def sink_format(path):
+	"""The suffix of path among SINK_FORMATS, or None."""
+	name = str(path).lower()
+	return next((suffix for suffix in sorted(SINK_FORMATS, key=len, reverse=True) if name.endswith(suffix)), None)
+
+
+class ArchiveSink(object):
+	"""Write the outputs of a run as the members of one tar or zip archive,
+	compressed according to the suffix of path (see SINK_FORMATS), as they
+	are added. Members are named by their output path relative to root,
+	which may be changed between corpora.
+
+	The archive is written to `<path>.part` and moved to path when the sink
+	is closed, or removed if the run fails. Only the process that opened
+	the sink writes to it: pool workers return their outputs instead.
+	"""
+
+	__slots__ = ['path',
+				 'root',
+				 'names',
+				 '_partial',
+				 '_file',
+				 '_tar',
+				 '_zip',
+				 ]
+
+	def __init__(self, path, root='.'):
+		suffix = sink_format(path)
+		if suffix is None:
+			raise ValueError(f"{path} is not a {', '.join(SINK_FORMATS)} archive")
+		self.path = Path(path)
+		self.root = Path(root)
+		self.names = set()
+		self._partial = Path(f"{path}.part")
+		self._partial.parent.mkdir(parents=True, exist_ok=True)
+		self._file = open(self._partial, 'wb')
+		self._tar = self._zip = None
+		try:
+			if SINK_FORMATS[suffix] is None:
+				import zipfile  # only paid for at startup when writing an archive
+				self._zip = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_DEFLATED)
+			else:  # named after path, as compressed streams record the name
+				import tarfile
+				self._tar = tarfile.open(str(self.path), SINK_FORMATS[suffix], self._file)
+		except BaseException:
+			self.close(False)
+			raise
+
+	def add(self, path, text):
+		"""Write text as the member for the output path."""
+		name = Path(os.path.relpath(path, self.root)).as_posix()
+		if name.startswith('../'):
+			raise ValueError(f"{path} is not under {self.root}")
+		if name in self.names:
+			logger.warning(f"{name} is written to the archive more than once, the last one is extracted")
+		self.names.add(name)
+		data = text.encode('utf-8')
+		if self._zip is not None:
+			import zipfile
+			info = zipfile.ZipInfo(name, time.localtime()[:6])
+			info.compress_type = zipfile.ZIP_DEFLATED
+			info.external_attr = 0o644 << 16
+			with warnings.catch_warnings():  # duplicate names are logged above
+				warnings.simplefilter('ignore', UserWarning)
+				self._zip.writestr(info, data)
+		else:
+			import tarfile
+			info = tarfile.TarInfo(name)
+			info.size = len(data)
+			info.mtime = time.time()
+			info.mode = 0o644
+			self._tar.addfile(info, io.BytesIO(data))
+
+	def close(self, keep=True):
+		"""Finish the archive and move it to path, or remove it unless keep.
+		If it cannot be finished, it is removed as well.
+		"""
+		try:
+			try:
+				for archive in (self._zip, self._tar):
+					if archive is not None:
+						archive.close()
+			finally:
+				self._file.close()
+		except BaseException:
+			self._partial.unlink(missing_ok=True)
+			raise
+		if keep:
+			os.replace(self._partial, self.path)
+		else:
+			self._partial.unlink()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close(exc_type is None)
@@ -0,0 +1,72 @@
+"""
+A bounded least-recently-used cache with hit/miss/eviction counters.
+"""
+from collections import OrderedDict
+
+
+class LRUCache(object):
+	"""Maps keys to values, keeping at most `maxsize` entries. When full,
+	the least recently used entry is evicted.
+	"""
+
+	__slots__ = ['maxsize',
+				 'hits',
+				 'misses',
+				 'evictions',
+				 '_data',
+				 ]
+
+	def __init__(self, maxsize=4096):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self._data = OrderedDict()
+
+	def __len__(self):
+		return len(self._data)
+
+	def __contains__(self, key):
+		return key in self._data
+
+	def get(self, key, default=None):
+		"""Return the value cached for key and mark it as recently used,
+		or default if key is not cached.
+		"""
+		try:
+			value = self._data[key]
+		except KeyError:
+			self.misses += 1
+			return default
+		self._data.move_to_end(key)
+		self.hits += 1
+		return value
+
+	def put(self, key, value):
+		"""Cache value for key, evicting the least recently used entry if
+		the cache is full.
+		"""
+		if self.maxsize <= 0:
+			return
+		self._data[key] = value
+		self._data.move_to_end(key)
+		if len(self._data) > self.maxsize:
+			self._data.popitem(last=False)
+			self.evictions += 1
+
+	def clear(self):
+		self._data.clear()
+
+	def info(self):
+		return {'hits': self.hits,
+				'misses': self.misses,
+				'evictions': self.evictions,
+				'size': len(self._data),
+				'maxsize': self.maxsize,
+				}
+
+	def __str__(self):
+		total = self.hits + self.misses
+		rate = self.hits / total if total else 0.0
+		return (f"{self.hits} hits, {self.misses} misses ({rate:.1%} hit rate), "
+				f"{self.evictions} evictions, {len(self._data)}/{self.maxsize} entries")
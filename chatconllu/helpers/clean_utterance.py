@@ -3,6 +3,7 @@ Utilities to obtain clean utterances from CHAT.
 """
 
 import re
+from functools import lru_cache
 # from logger import logger
 
 until_eow = re.compile(r"[^,.;?!”<>\[\] ]+")
@@ -41,7 +42,8 @@ omission = [
 	]
 # -------- define delete previous token/scope pattern --------
 retracing_no_angle_brackets = r"^\[/(?:[\-/?])?\]"  # [//] or [/?] or [/] or [/-] --> [retrace]
-x_retrace = r"^\[[=%?] [()@\-\+\.\"\w]+(\')?\w*( [()@\-\+\.\"\w]+)*( )??\] \[/(?:[/?])?\]"
+# each character can only be matched one way, so a near miss fails in linear time
+x_retrace = r"^\[[=%?] [()@\-\+\.\"\w]+(?:'\w*)?(?: [()@\-\+\.\"\w]+)* ?\] \[/[/?]?\]"
 
 delete_previous = [
 	retracing_no_angle_brackets,
@@ -85,6 +87,11 @@ special_terminators = re.compile(r'^\+(?:/(?:/\.|[.?])|"/\.)')
 
 quotation = re.compile(r"[“”]")
 
+# characters and tokens any of the patterns above could act on: angle brackets,
+# bracketed codes, +codes, (pauses), quotation marks, `;`, commas attached to
+# words and tokens made of `:` and `/` only
+markup = re.compile(r"[<>\[\];+“”(]|[^\W\d_],|^,|(?:^| )[:/]+(?: |$)")
+
 
 def push(obj, l, depth):
 	"""Based on the answer on
@@ -98,11 +105,21 @@ def push(obj, l, depth):
 		depth -= 1
 	l.append(obj)
 
-def normalise_utterance(line):
+def is_plain(line):
+	"""Whether the line has no CHAT markup for normalise_utterance() to resolve,
+	i.e. its tokens are the line split on spaces.
+	"""
+	return not markup.search(line)
+
+def normalise_utterance(line, fast=True):
 	""" Based on the answer on
 		https://stackoverflow.com/questions/4284991/\
 		parsing-nested-parentheses-in-python-grab-content-by-level
 		Transform nested angle brackets into nested lists, also take [<] and [>] into account.
+
+		If fast, plain lines (see is_plain()) are split on spaces directly and
+		other lines are normalised by scan_utterance(); otherwise the state
+		machine below is run, which is kept as the reference.
 	"""
 	# logger.info(line)
 	if line is None:
@@ -110,6 +127,11 @@ def normalise_utterance(line):
 
 	if line == "0 .":
 		return [], line
+
+	if fast:
+		if is_plain(line):
+			return [t for t in line.split(' ') if t], line
+		return scan_utterance(line), line
 	groups = []
 	depth = 0
 
@@ -196,13 +218,13 @@ def remove_elements(flat):
 	keep = True
 
 	for i, f in enumerate(flat):
-		if re.match(start_bracket, f):
+		if isinstance(f, str) and re.match(start_bracket, f):
 			keep = False
 
 		if keep:
 			results.append(f)
 
-		if not keep and f.endswith(']'):
+		if not keep and isinstance(f, str) and f.endswith(']'):
 			keep = True
 
 	return results
@@ -215,10 +237,7 @@ def replace_token(flat):
 	# print(flat)
 
 	for i, f in enumerate(flat):
-		if isinstance(f, list):
-			replace_token(f)
-
-		elif re.match(to_replace, f):
+		if isinstance(f, str) and re.match(to_replace, f):
 			replace = True
 
 		if replace:
@@ -226,9 +245,9 @@ def replace_token(flat):
 		else:
 			results.append(f)
 		# ---- start replacing ----
-		if replace and f.endswith(']'):
+		if replace and isinstance(f, str) and f.endswith(']'):
 			replace_tmp[-1] = replace_tmp[-1][:-1]
-			results.pop()
+			if results: results.pop()
 			results += replace_tmp[1:]
 			replace_tmp = []
 			replace = False
@@ -256,65 +275,301 @@ def replace_token(flat):
 
 # 	return results
 
+@lru_cache(maxsize=4096)
+def omit_token(tmp):
+	"""Strip the codes to omit from a token, may return an empty string."""
+	if special_terminators.match(tmp):
+		tmp = tmp[-1]
+	tmp = to_omit.sub('', tmp)
+	tmp = quotation.sub('', tmp)
+	tmp = delete_prev.sub('', tmp)  # patterns are anchored, as are the ones below
+	tmp = overlap.sub('', tmp)
+	if trailing_off.match(tmp):
+		tmp = tmp[1:]  # remove +
+	return tmp
+
 def omit(flat):
-	result = flat.copy()
-	for i, f in enumerate(flat):
-		tmp = f
-		if re.match(special_terminators, tmp):
-			tmp = tmp[-1]
-		if re.search(to_omit, tmp):
-			tmp = re.sub(to_omit, '', tmp)
-		if re.search(quotation, tmp):
-			tmp = re.sub(quotation, '', tmp)
-		if re.match(delete_prev, tmp):
-			tmp = re.sub(delete_prev, '', tmp)
-		if re.match(overlap, tmp):
-			tmp = re.sub(overlap, '', tmp)
-		if re.match(trailing_off, tmp):
-			tmp = tmp[1:]  # remove +
-		result[i] = tmp
+	result = [omit_token(f) for f in flat]
 	return [r for r in result if r]
 
+class Scope(object):
+	"""The tokens of one angle-bracket scope, with the positions of the first
+	tokens that remove_elements() and replace_token() act on, so that a
+	retrace marker only rewrites the scope when they are present.
+	"""
+
+	__slots__ = ['tokens',
+				 'start',
+				 'replace',
+				 'exact',
+				 ]
+
+	def __init__(self, tokens=None):
+		self.tokens = [] if tokens is None else tokens
+		self.start = None  # first token matching start_bracket
+		self.replace = None  # first token matching to_replace
+		self.exact = None  # first token "[:" or "[::"
+
+	def append(self, token):
+		if token[:1] == '[':
+			self._mark(token, len(self.tokens))
+		self.tokens.append(token)
+
+	def _mark(self, token, i):
+		if self.start is None and start_bracket.match(token):
+			self.start = i
+		if self.replace is None and to_replace.match(token):
+			self.replace = i
+			if self.exact is None and (token == "[:" or token == "[::"):
+				self.exact = i
+		elif self.exact is None and (token == "[:" or token == "[::"):
+			self.exact = i
+
+	def _rewrite(self, i, func):
+		"""Apply func to the tokens from i on, which leaves the ones before
+		unchanged, and find the positions again from there.
+		"""
+		tokens = self.tokens
+		tokens[i:] = func(tokens[i:])
+		if self.start is not None and self.start >= i:
+			self.start = None
+		if self.replace is not None and self.replace >= i:
+			self.replace = None
+		if self.exact is not None and self.exact >= i:
+			self.exact = None
+		for k in range(i, len(tokens)):
+			t = tokens[k]
+			if isinstance(t, str) and t[:1] == '[':
+				self._mark(t, k)
+
+	def _pop(self):
+		tokens = self.tokens
+		if not tokens:
+			return None
+		out = tokens.pop()
+		n = len(tokens)
+		if self.start == n:
+			self.start = None
+		if self.replace == n:
+			self.replace = None
+		if self.exact == n:
+			self.exact = None
+		return out
+
+	def retrace(self):
+		"""Delete the element a retrace marker refers to, as delete() does."""
+		tokens = self.tokens
+		last = tokens[-1] if tokens else None
+		if (isinstance(last, str) and last.endswith(']') and not last.startswith('[')
+				and self.start is not None):
+			self._rewrite(self.start, remove_elements)
+		if self.exact is not None:  # a replacement may drop any earlier token, rewrite them all
+			self._rewrite(0, replace_token)
+		out = self._pop()
+		if not out:  # e.g. the empty token a replacement ending in " ]" leaves
+			return
+		while isinstance(out, str) and (to_omit.match(out) or overlap.match(out)):
+			out = self._pop()
+
 def delete(groups):
 	""" Delete from nested list the elements followed by members in delete_prev.
+
+		Nested lists are walked with a stack rather than recursively, and each
+		retrace marker only rewrites the tokens of its scope not yet resolved.
 	"""
-	results = []
-	for g in groups:
-		# print(f"===== iteration for {groups} =====")
-		# print(f"current g is: {g}")
-		if isinstance(g, list):
-			# print(f"{g} is list...")
-			results.append(delete(g))
-		elif re.match(delete_prev, g):
-			# print(f"{g} match delete previous")
-			# print(f"{results}")
-			if results and not isinstance(results[-1], list) and results[-1].endswith(']') and not results[-1].startswith('['):
-				# print("remove elements on results.")
-				results = remove_elements(results)
-			if "[:" in results or "[::" in results:
-				results = replace_token(results)
-				# logger.info(results)
-				out = results.pop() if results else None
-				# logger.info(results)
+	top = Scope()
+	stack = [(iter(groups), top)]
+	while stack:
+		it, scope = stack[-1]
+		for g in it:
+			if isinstance(g, list):
+				inner = Scope()
+				scope.tokens.append(inner.tokens)  # filled in place
+				stack.append((iter(g), inner))
+				break
+			if re.match(delete_prev, g):
+				scope.retrace()
+			else:
+				scope.append(g)
+		else:
+			stack.pop()
+	return top.tokens
+
+
+# -------- single-pass engine --------
+# a main line is cut into runs of ordinary characters, runs of spaces and
+# the characters the state machine in normalise_utterance() reacts to
+piece = re.compile(r"([^ <>\[\],]+)(?: +|$)|[^ <>\[\],]+| +|[<>\[\],]")
+# `[` or `,` glued to a word, which the state machine cuts off
+glued = re.compile(r"[\[,](?<=[^\W\d_][\[,])")
+# tokens omit_token() may change, besides those starting with one of ([+
+omit_candidate = re.compile(r"[;“”]|^[:/]+$")
+omit_chars = re.compile(r"[;“”:/]")
+
+
+def is_structural(line):
+	"""Whether the state machine of normalise_utterance() may cut the line
+	other than on spaces.
+	"""
+	return ('<' in line or '>' in line or '][' in line or line.startswith(',')
+			or glued.search(line) is not None)
+
+def scan(line):
+	"""Cut a main line into nested scopes of tokens like the state machine of
+	normalise_utterance() does, resolving retrace markers as soon as they are
+	seen, like delete() does.
+	"""
+	top = Scope()
+	stack = [top]
+	scope = top
+	tmp = ''
+
+	def push(token):
+		if token[0] == '[' and delete_prev.match(token):
+			scope.retrace()
+		else:
+			scope.append(token)
+
+	for m in piece.finditer(line):
+		word = m.group(1)
+		if word:  # the common case, a run of ordinary characters followed by spaces
+			if tmp:
+				word = tmp + word
+				tmp = ''
+			push(word)
+			continue
+		p = m.group()
+		c = p[0]
+		if c == ' ':
+			if tmp:
+				push(tmp)
+				tmp = ''
+		elif len(p) > 1 or c not in '<>[],':
+			tmp += p
+		elif c == '<':
+			i = m.start()
+			if i != 0 and (line[i-1] == '[' or line[i-1] == '+'):  # scoped symbol, do not open
+				tmp += c
+				if m.end() == len(line):  # final token is not pushed after a scoped symbol
+					tmp = ''
+			else:
+				group = Scope()
+				scope.tokens.append(group.tokens)  # filled in place
+				stack.append(group)
+				scope = group
+		elif c == '>':
+			i = m.start()
+			if i != 0 and line[i-1] == '[' or len(stack) == 1:  # scoped symbol, do not close
+				tmp += c
+				if m.end() == len(line):
+					tmp = ''
+			else:
+				if tmp:
+					push(tmp)
+					tmp = ''
+				stack.pop()
+				scope = stack[-1]
+		elif c == ']':
+			tmp += c
+			if line.startswith('[', m.end()):
+				push(tmp)
+				tmp = ''
+		elif c == '[':
+			i = m.start()
+			if i-1 >= 0 and line[i-1].isalpha():
+				if tmp:
+					push(tmp)
+				tmp = c
+			else:
+				tmp += c
+		else:  # ','
+			if line[m.start()-1].isalpha():
+				if tmp:
+					push(tmp)
+					tmp = ''
+				push(c)
 			else:
-				out = results.pop() if results else None
-			# print(f"after pop: {results}")
-			if out:
-				while not isinstance(out, list) and (re.match(to_omit, out) or re.match(overlap, out)):
-					# print(f"{out} trigger while")
-					# if re.match(to_omit, out):
-					#   print("1")
-					# elif re.match(overlap, out):
-					#   print("2")
-					out = results.pop() if results else None
-					# print(f"while loop pop {out} : {results}")
+				tmp += c
+	if tmp:
+		push(tmp)
+	return top.tokens
+
+def flat_tokens(groups):
+	"""Yield the tokens of nested lists in order."""
+	nested = [iter(groups)]
+	while nested:
+		for g in nested[-1]:
+			if isinstance(g, list):
+				nested.append(iter(g))
+				break
+			yield g
 		else:
-			# print(f"append {g} to results")
-			results.append(g)
-	# print(f"final results: {results}")
+			nested.pop()
+
+def resolve(tokens, candidates=True):
+	"""Omit, remove and replace tokens in one walk, like omit(),
+	remove_elements() and replace_token() do in turn. Empty tokens are
+	skipped. If not candidates, only tokens starting with one of ([+ are
+	passed to omit_token().
+	"""
+	results = []
+	keep = True  # see remove_elements()
+	replace = False  # see replace_token()
+	replace_tmp = []
+	for tok in tokens:
+		if not tok:
+			continue
+		c = tok[0]
+		if c in '([+' or candidates and omit_candidate.search(tok):
+			tok = omit_token(tok)
+			if not tok:
+				continue
+			c = tok[0]
+		if c == '[':
+			if start_bracket.match(tok):
+				keep = False
+			elif keep and to_replace.match(tok):
+				replace = True
+		if not keep:
+			if tok.endswith(']'):
+				keep = True
+		elif replace:
+			replace_tmp.append(tok)
+			if tok.endswith(']'):
+				replace_tmp[-1] = replace_tmp[-1][:-1]
+				if results: results.pop()
+				results += replace_tmp[1:]
+				replace_tmp = []
+				replace = False
+		else:
+			results.append(tok)
 	return results
 
+def scan_utterance(line):
+	"""Normalise a main line in a single pass, giving the same tokens as the
+	state machine of normalise_utterance() followed by delete(), flatten(),
+	omit(), remove_elements() and replace_token().
 
+	The line is cut into tokens by one compiled pattern, or simply split on
+	spaces if it has no angle brackets or glued codes. Retrace markers are
+	resolved as soon as they are seen, within a stack of angle-bracket
+	scopes; the surviving tokens are then omitted, filtered and replaced in
+	one walk.
+	"""
+	candidates = omit_chars.search(line) is not None
+	if is_structural(line):
+		return resolve(flat_tokens(scan(line)), candidates)
+	if '[/' not in line:  # no retracing
+		return resolve(line.split(' '), candidates)
+	top = Scope()
+	for tok in line.split(' '):
+		if not tok:
+			continue
+		if tok[0] == '[' and delete_prev.match(tok):
+			top.retrace()
+		else:
+			top.append(tok)
+	return resolve(top.tokens, candidates)
 
 if __name__ == '__main__':
 	# print(normalise_utterance('<du [/] <in &Kin> [/] <in im &Ki> [/] im Kinderladen xxx>')) # ['a', ['b', ['c', 'd'], 'f']]
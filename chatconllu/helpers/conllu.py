@@ -0,0 +1,147 @@
+"""
+A streaming reader of CoNLL-U files, yielding the sentences one by one
+with their comments in order and their tokens with MISC already split, as
+needed to convert them back to CHAT. Comments and fields are read as
+pyconll reads them.
+
+Also the encoding of dependent tiers in comments.
+"""
+import re
+import json
+
+from helpers.archive import open_input
+
+KEY_VALUE = re.compile(r"#\s*([^=]+?)\s*=\s*(.+)")
+SINGLETON = re.compile(r"#\s*(\S.*?)\s*$")
+TIER_ENCODING = 'tier_encoding'  # header comment of files whose tiers are written by encode_tier()
+
+
+def encode_tier(text):
+	"""The text of a dependent tier as the value of a comment: the text
+	itself, or a JSON string if it is empty, starts with a double quote or
+	has surrounding whitespace, which the comment would lose.
+	"""
+	if not text or text[0] == '"' or text != text.strip():
+		return json.dumps(text, ensure_ascii=False)
+	return text
+
+
+def decode_tier(value):
+	"""The text of a dependent tier from a comment value written by
+	encode_tier().
+	"""
+	return json.loads(value) if value[0] == '"' else value
+
+
+def parse_misc(field):
+	"""MISC as a dict of each key to the list of its comma separated values,
+	or to None if it has no value.
+	"""
+	misc = {}
+	if field == '_':
+		return misc
+	for el in field.split('|'):
+		k, _, v = el.partition('=')
+		misc[k] = v.split(',') if v else None
+	return misc
+
+
+class ConlluToken(object):
+	"""A token line. Empty fields are None, except FORM and LEMMA when both
+	are `_`; FEATS and DEPS are kept as they are written.
+	"""
+
+	__slots__ = ['id',
+				 'form',
+				 'lemma',
+				 'upos',
+				 'xpos',
+				 'feats',
+				 'head',
+				 'deprel',
+				 'deps',
+				 'misc',
+				 ]
+
+	def __init__(self, line):
+		fields = line.split('\t')
+		if len(fields) != 10:
+			raise ValueError(f"The number of columns per token line must be 10. Invalid token: {line}")
+		self.id, form, lemma, upos, xpos, self.feats, head, deprel, self.deps, misc = fields
+		if form == '_' and lemma == '_':
+			self.form = self.lemma = '_'
+		else:
+			self.form = None if form == '_' else form
+			self.lemma = None if lemma == '_' else lemma
+		self.upos = None if upos == '_' else upos
+		self.xpos = None if xpos == '_' else xpos
+		self.head = None if head == '_' else head
+		self.deprel = None if deprel == '_' else deprel
+		self.misc = parse_misc(misc)
+
+	def is_multiword(self):
+		return '-' in self.id
+
+
+class ConlluSentence(object):
+	"""The comments of a sentence, as an ordered dict of keys to values (None
+	for comments that are not `key = value` pairs), and its tokens.
+	"""
+
+	__slots__ = ['meta',
+				 'tokens',
+				 ]
+
+	def __init__(self, meta, tokens):
+		self.meta = meta
+		self.tokens = tokens
+
+	@property
+	def id(self):
+		return self.meta.get('sent_id')
+
+	def __iter__(self):
+		return iter(self.tokens)
+
+	def __len__(self):
+		return len(self.tokens)
+
+
+def iter_conllu(lines):
+	"""Yield the sentences of CoNLL-U lines, separated by blank lines, as
+	they are read.
+	"""
+	meta = {}
+	tokens = []
+	started = False
+	for n, line in enumerate(lines, 1):
+		line = line.strip()
+		if not line:
+			if started:
+				yield ConlluSentence(meta, tokens)
+				meta = {}
+				tokens = []
+				started = False
+			continue
+		started = True
+		if line[0] == '#':
+			m = KEY_VALUE.match(line)
+			if m:
+				meta[m.group(1)] = m.group(2)
+			else:
+				m = SINGLETON.match(line)
+				if m:
+					meta[m.group(1)] = None
+		else:
+			try:
+				tokens.append(ConlluToken(line))
+			except ValueError as e:
+				raise ValueError(f"line {n}: {e}") from None
+	if started:
+		yield ConlluSentence(meta, tokens)
+
+
+def iter_conllu_file(f):
+	"""Yield the sentences of the CoNLL-U file f as they are read."""
+	with open_input(f) as fp:
+		yield from iter_conllu(fp)
@@ -0,0 +1,98 @@
+"""
+A per-sentence index of the dependencies in %gra, built once so that
+conditional GR to deprel rules do not scan the whole sentence.
+"""
+
+
+def is_root(tok):
+	"""Whether the token is a root candidate in multi-root sentences."""
+	if tok.deprel == 'root' or tok.deprel == 'incroot':
+		return True
+	return tok.head == '0' and tok.deprel not in ['vocative', 'parataxis']
+
+
+def to_int(value):
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+
+class DependencyIndex(object):
+	"""Heads, dependents and UPOS of the words of one sentence by word index
+	(position 0 is the artificial root), as given in %gra, and the root of
+	the sentence as tokens are translated in order.
+
+	heads[i] is the head of word i, children[i] the words depending on word
+	i and upos[i] the UPOS of word i; None where unknown. They follow the
+	heads changed with set_head().
+	"""
+
+	__slots__ = ['tokens',
+				 'heads',
+				 'children',
+				 'upos',
+				 '_last',
+				 '_root',
+				 '_next',
+				 ]
+
+	def __init__(self, tokens):
+		self.tokens = tokens
+		words = []
+		for tok in tokens:
+			if tok.multi:  # multi-word tokens, tok.multi is the last word index
+				heads = tok.head or []
+				upos = tok.upos or []
+				for k in range(tok.multi - tok.index + 1):
+					words.append((tok.index + k,
+								  to_int(heads[k]) if k < len(heads) else None,
+								  upos[k] if k < len(upos) else None))
+			else:
+				words.append((tok.index, to_int(tok.head), tok.upos))
+		size = max((w[0] for w in words if isinstance(w[0], int)), default=0) + 1
+		self.heads = [None] * size
+		self.upos = [None] * size
+		self.children = [[] for _ in range(size)]
+		for i, head, upos in words:
+			if not isinstance(i, int) or i < 0:
+				continue
+			self.heads[i] = head
+			self.upos[i] = upos
+			if head is not None and 0 <= head < size:
+				self.children[head].append(i)
+		# last root candidate among the tokens not translated yet, see root()
+		self._last = max((k for k, tok in enumerate(tokens) if is_root(tok)), default=-1)
+		self._root = -1
+		self._next = 0
+
+	def root(self):
+		"""Index of the real root in multi-root sentences: the last root
+		candidate, taking tokens already translated as they are now.
+		"""
+		if self._last >= self._next:
+			root_idx = self.tokens[self._last].index
+		else:
+			root_idx = self._root
+		return root_idx if root_idx > 0 else None
+
+	def advance(self, tok):
+		"""Mark the next token, tok, as translated."""
+		if is_root(tok):
+			self._root = tok.index
+		self._next += 1
+
+	def set_head(self, i, head):
+		"""Change the head of word i to head, e.g. when it is attached to the
+		root instead.
+		"""
+		if not isinstance(i, int) or not 0 <= i < len(self.heads):
+			return
+		old = self.heads[i]
+		if old is not None and 0 <= old < len(self.children):
+			self.children[old].remove(i)
+		head = to_int(head)
+		self.heads[i] = head
+		if head is not None and 0 <= head < len(self.children):
+			self.children[head].append(i)
+			self.children[head].sort()
@@ -0,0 +1,186 @@
+"""
+Aggregate repeated diagnostics, such as MOR codes or GRs without a UD
+counterpart, instead of logging every occurrence. Each (kind, value) key
+is counted with the file and sentence where it was first seen; only its
+first occurrence is logged (at DEBUG level), and the counts are logged as
+a table after each file and at the end of a run.
+
+Memoized functions that note diagnostics (e.g. to_upos()) are wrapped
+with memoize(), and cached utterances keep what they noted (see
+capture()), so that cache hits are counted like the first occurrence.
+"""
+import logging
+from functools import lru_cache, wraps
+
+from logger import logger
+
+MESSAGES = {
+	'upos': "{} does not have a corresponding UPOS in MOR2UPOS.",
+	'feats': "{} does not have a corresponding UD feature in MOR2FEATS.",
+	'deprel': "{} does not have a corresponding deprel in GR2DEPREL.",
+	'beg': "BEG but not vocative ({}).",
+	'mor_length': "clean and mor should have the same length!",
+	'no_tokens': "sentence has no tokens, check if it's well-formed.",
+	'no_utterance': "sentence has no utterance.",
+}
+FILE_ROWS = 10  # rows of the table logged after each file
+RUN_ROWS = 50  # rows of the table logged at the end of a run
+
+
+class Tally(object):
+	"""The number of occurrences of each key and where it was first seen."""
+
+	__slots__ = ['counts',
+				 'first',
+				 ]
+
+	def __init__(self):
+		self.counts = {}
+		self.first = {}
+
+	def add(self, key, where, n=1):
+		if key in self.counts:
+			self.counts[key] += n
+		else:
+			self.counts[key] = n
+			self.first[key] = where
+
+	def update(self, other: 'Tally'):
+		for key, n in other.counts.items():
+			self.add(key, other.first[key], n)
+
+	def __len__(self):
+		return len(self.counts)
+
+	def total(self) -> int:
+		return sum(self.counts.values())
+
+	def table(self, rows: int) -> str:
+		"""The most frequent keys, one per line with their count, message and
+		first location.
+		"""
+		keys = sorted(self.counts, key=lambda k: -self.counts[k])
+		width = len(str(self.counts[keys[0]])) if keys else 1
+		lines = [f"{self.counts[k]:>{width}}  {message(k)}  (first: {location(self.first[k])})" for k in keys[:rows]]
+		if len(keys) > rows:
+			lines.append(f"... and {len(keys) - rows} more")
+		return "\n".join(lines)
+
+
+def message(key) -> str:
+	kind, value = key
+	return MESSAGES.get(kind, kind + ": {}").format(value)
+
+
+def location(where) -> str:
+	f, sentence = where
+	return f"{f}, sent {sentence}" if sentence is not None else str(f)
+
+
+_where = [None, None]  # file and sentence being converted
+_captured = []  # keys noted in the captures being collected, innermost last
+_file = Tally()
+_run = Tally()
+
+
+def begin_file(f):
+	"""Start counting the diagnostics of file f."""
+	global _file
+	_file = Tally()
+	_where[0] = f
+	_where[1] = None
+
+
+def at(sentence):
+	"""Record the id of the sentence being converted."""
+	_where[1] = sentence
+
+
+def note(kind: str, value=None):
+	"""Count an occurrence of a diagnostic, logging only its first."""
+	key = (kind, value)
+	if _captured:
+		_captured[-1].append(key)
+		return
+	counts = _file.counts
+	if key in counts:
+		counts[key] += 1
+		return
+	where = tuple(_where)
+	counts[key] = 1
+	_file.first[key] = where
+	if logger.isEnabledFor(logging.DEBUG):
+		logger.debug(f"{message(key)} (first: {location(where)})")
+
+
+def capture():
+	"""Collect, rather than count, the diagnostics noted until release()."""
+	_captured.append([])
+
+
+def release() -> tuple:
+	"""The keys noted since the matching capture(), to be counted with
+	replay(), now and whenever the result they were noted for is reused.
+	"""
+	return tuple(_captured.pop())
+
+
+def replay(keys: tuple):
+	"""Count the diagnostics collected by a capture()."""
+	for kind, value in keys:
+		note(kind, value)
+
+
+def memoize(maxsize: int):
+	"""lru_cache for a function that notes diagnostics. The cached function
+	returns the keys noted with its result, and each call counts them, so
+	that they are counted per occurrence rather than per cache miss.
+	"""
+	def decorator(func):
+		@lru_cache(maxsize=maxsize)
+		def cached(*args, **kwargs):
+			capture()
+			try:
+				result = func(*args, **kwargs)
+			finally:
+				keys = release()
+			return result, keys
+
+		@wraps(func)
+		def wrapper(*args, **kwargs):
+			result, keys = cached(*args, **kwargs)
+			if keys:
+				replay(keys)
+			return result
+
+		wrapper.cache_info = cached.cache_info
+		wrapper.cache_clear = cached.cache_clear
+		return wrapper
+	return decorator
+
+
+def end_file() -> Tally:
+	"""Log the diagnostics of the current file and return them, to be
+	added to the run with merge().
+	"""
+	tally, f = _file, _where[0]
+	begin_file(None)
+	if tally:
+		logger.info(f"{f}: {tally.total()} diagnostics, {len(tally)} distinct:\n{tally.table(FILE_ROWS)}")
+	return tally
+
+
+def merge(tally: Tally):
+	"""Add the diagnostics of a file to the run."""
+	if tally:
+		_run.update(tally)
+
+
+def end_run() -> Tally:
+	"""Log the diagnostics of the run and start a new one."""
+	global _run
+	tally = _run
+	_run = Tally()
+	if tally:
+		logger.warning(f"{tally.total()} diagnostics, {len(tally)} distinct, in this run:\n{tally.table(RUN_ROWS)}")
+	return tally
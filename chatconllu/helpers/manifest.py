@@ -0,0 +1,105 @@
+"""
+A manifest of the conversions done in a corpus directory, keyed by the
+content hash of each input, the conversion flags and the tool version, so
+that unchanged files can be skipped.
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+from functools import lru_cache
+
+from helpers.archive import ZipMember, open_input
+
+MANIFEST_NAME = ".chatconllu-manifest.json"
+VERSION = "0.0.1"
+_SOURCES = ["chatparser.py", "conlluparser.py", "features.py", "helpers/clean_utterance.py", "helpers/conllu.py",
+			"helpers/dependency.py", "helpers/sentence.py", "helpers/token.py"]
+
+
+def file_hash(path):
+	"""Hex sha256 digest of a file's content."""
+	h = hashlib.sha256()
+	with open_input(path, 'rb') as fp:
+		for chunk in iter(lambda: fp.read(1 << 20), b''):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def tool_version():
+	"""The version, with a digest of the converter sources so that local
+	changes to them also invalidate previous conversions.
+	"""
+	root = Path(__file__).resolve().parents[1]
+	h = hashlib.sha256()
+	for source in _SOURCES:
+		h.update(Path(root, source).read_bytes())
+	return f"{VERSION}+{h.hexdigest()[:12]}"
+
+
+class Manifest(object):
+	"""The manifest of a corpus directory. Each input is recorded with the
+	key of its last conversion and the output written. Unless stored sizes
+	and modification times show an input is untouched, its content is
+	hashed again.
+	"""
+
+	__slots__ = ['path',
+				 'entries',
+				 'version',
+				 ]
+
+	def __init__(self, directory):
+		self.path = Path(directory, MANIFEST_NAME)
+		self.entries = {}
+		if self.path.is_file():
+			with open(self.path, encoding='utf-8') as fp:
+				self.entries = json.load(fp)
+		self.version = tool_version()
+
+	def _name(self, f):
+		if isinstance(f, ZipMember):
+			return str(f)
+		try:
+			return Path(f).resolve().relative_to(self.path.parent.resolve()).as_posix()
+		except ValueError:  # outside the corpus directory
+			return str(Path(f).resolve())
+
+	def key(self, f, flags):
+		"""The key of converting f with flags (a dict) now."""
+		st = f.stat() if isinstance(f, ZipMember) else os.stat(f)
+		old = self.entries.get(self._name(f), {})
+		if old.get('size') == st.st_size and old.get('mtime') == st.st_mtime_ns:
+			digest = old['hash']
+		else:
+			digest = file_hash(f)
+		return {'hash': digest,
+				'flags': flags,
+				'version': self.version,
+				'size': st.st_size,
+				'mtime': st.st_mtime_ns,
+				}
+
+	def is_current(self, f, output, key):
+		"""Whether output, a path or a list of paths, exists and was
+		converted from f with the same key.
+		"""
+		old = self.entries.get(self._name(f))
+		outputs = output if isinstance(output, list) else [output]
+		return (old is not None and all(Path(o).is_file() for o in outputs)
+				and old.get('output') == _stored(output)
+				and all(old.get(k) == key[k] for k in ('hash', 'flags', 'version')))
+
+	def record(self, f, output, key):
+		self.entries[self._name(f)] = dict(key, output=_stored(output))
+
+	def save(self):
+		tmp = self.path.with_suffix('.tmp')
+		with open(tmp, 'w', encoding='utf-8') as fp:
+			json.dump(self.entries, fp, indent=1, sort_keys=True)
+		os.replace(tmp, self.path)
+
+
+def _stored(output):
+	return [str(o) for o in output] if isinstance(output, list) else str(output)
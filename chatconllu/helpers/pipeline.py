@@ -0,0 +1,115 @@
+"""
+Overlap reading, converting and writing files: a reader thread prefetches
+upcoming files and a writer thread flushes finished outputs while the
+calling thread converts, joined by bounded queues.
+"""
+import threading
+from queue import Queue, Full, Empty
+
+from helpers.archive import open_input
+
+_DONE = object()
+
+
+def read_text(f):
+	with open_input(f) as fp:
+		return fp.read()
+
+
+def write_text(fn, text):
+	with open(fn, 'w', encoding='utf-8') as fp:
+		fp.write(text)
+
+
+class _Stage(threading.Thread):
+	"""A daemon thread running target(stop), keeping the first exception."""
+
+	def __init__(self, target, stop):
+		super().__init__(daemon=True)
+		self.target = target
+		self.stop = stop
+		self.error = None
+
+	def run(self):
+		try:
+			self.target(self.stop)
+		except BaseException as e:
+			self.error = e
+			self.stop.set()
+
+
+def _put(queue, item, stop):
+	"""Put item in queue unless the pipeline is stopped while waiting."""
+	while not stop.is_set():
+		try:
+			queue.put(item, timeout=0.1)
+			return True
+		except Full:
+			pass
+	return False
+
+
+def _get(queue, stop):
+	while True:
+		try:
+			return queue.get(timeout=0.1)
+		except Empty:
+			if stop.is_set():
+				return _DONE
+
+
+def run_pipeline(files, convert, write, depth=2, read=read_text):
+	"""For every file f in order, call read(f) in a reader thread, then
+	convert(f, data) in this thread, then write(f, result) in a writer
+	thread.
+
+	At most `depth` files wait to be converted and `depth` results wait to
+	be written, so memory is bounded by about 2 * depth + 1 files. The
+	first exception raised in any stage stops the pipeline and is raised
+	here.
+	"""
+	stop = threading.Event()
+	inputs = Queue(maxsize=max(1, depth))
+	outputs = Queue(maxsize=max(1, depth))
+
+	def reader(stop):
+		for f in files:
+			try:
+				item = (f, read(f), None)
+			except Exception as e:  # raised when f is due, in order
+				item = (f, None, e)
+			if not _put(inputs, item, stop):
+				return
+		_put(inputs, _DONE, stop)
+
+	def writer(stop):
+		while True:
+			item = _get(outputs, stop)
+			if item is _DONE:
+				return
+			write(*item)
+
+	stages = [_Stage(reader, stop), _Stage(writer, stop)]
+	for stage in stages:
+		stage.start()
+	try:
+		while True:
+			item = _get(inputs, stop)
+			if item is _DONE:
+				break
+			f, data, error = item
+			if error is not None:
+				raise error
+			if not _put(outputs, (f, convert(f, data)), stop):
+				break
+		_put(outputs, _DONE, stop)
+		stages[1].join()
+	except BaseException:
+		stop.set()
+		raise
+	finally:
+		for stage in stages:
+			stage.join()
+	for stage in stages:
+		if stage.error is not None:
+			raise stage.error
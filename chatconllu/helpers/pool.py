@@ -0,0 +1,69 @@
+"""
+Run file conversions in a pool of processes, with the log records of the
+workers passed on to the handlers of the main process.
+"""
+from logging.handlers import QueueHandler, QueueListener
+
+from logger import logger
+
+
+def _init_worker(queue, level):
+	"""Send the records of the worker's logger to the main process."""
+	logger.handlers = [QueueHandler(queue)]
+	logger.setLevel(level)
+
+
+def run_jobs(func, tasks, jobs=1, done=None):
+	"""Call func(*task) for every task and return the tasks that failed.
+	If done is given, it is called in this process with the result of
+	every task that succeeded.
+
+	With more than one job, tasks are spread across a pool of `jobs`
+	processes and a task raising an exception is logged without stopping
+	the others. Each task should write its own output files, or return
+	them to be written by done, which is called in the order of tasks, so
+	that the output does not depend on the order in which tasks finish. With one
+	job, tasks run in order in this process and exceptions propagate.
+	A single task also runs in this process, but its failure is still
+	logged and returned when jobs > 1.
+	"""
+	tasks = list(tasks)
+	if jobs <= 1:
+		for task in tasks:
+			result = func(*task)
+			if done is not None:
+				done(result)
+		return []
+	if len(tasks) <= 1:  # not worth starting a pool
+		for task in tasks:
+			try:
+				result = func(*task)
+			except Exception:
+				logger.exception(f"failed to convert {task[0]}")
+				return [task]
+			if done is not None:
+				done(result)
+		return []
+
+	import multiprocessing  # only needed, and paid for at startup, with several jobs
+	from concurrent.futures import ProcessPoolExecutor
+
+	failed = []
+	queue = multiprocessing.Queue()
+	listener = QueueListener(queue, *logger.handlers, respect_handler_level=True)
+	listener.start()
+	try:
+		with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(queue, logger.level)) as pool:
+			futures = [pool.submit(func, *task) for task in tasks]
+			for task, future in zip(tasks, futures):
+				try:
+					result = future.result()
+				except Exception:
+					logger.exception(f"failed to convert {task[0]}")
+					failed.append(task)
+					continue
+				if done is not None:
+					done(result)
+	finally:
+		listener.stop()
+	return failed
@@ -44,12 +44,18 @@ class Sentence(object):
     def get_sent_id(self):
         return self.sent_id
 
+    def rebind(self, speaker, sent_id):
+        """Return a shallow copy of the sentence with another speaker and sent_id."""
+        sent = Sentence(**{x: getattr(self, x) for x in self.__slots__})
+        sent.speaker = speaker
+        sent.sent_id = sent_id
+        return sent
+
     def conllu_str(self, clear_mor=False, clear_gra=False, clear_misc=False, mute=False):
-        s = ""
-        if self.toks:
-            for tok in self.toks:
-                if mute:
-                    s += "# " + tok.conllu_str(clear_mor, clear_gra, clear_misc)
-                else:
-                    s += tok.conllu_str(clear_mor, clear_gra, clear_misc)
-        return s
+        """The tokens as CoNLL-U lines, commented out if mute. The tokens are
+        left unchanged, so the sentence can be written several times.
+        """
+        if not self.toks:
+            return ""
+        prefix = "# " if mute else ""
+        return "".join([prefix + tok.conllu_str(clear_mor, clear_gra, clear_misc) for tok in self.toks])
@@ -58,81 +58,40 @@ class Token(object):
 
 	def conllu_str(self, clear_mor=False, clear_gra=False, clear_misc=False):
 		"""Writes token as one line in conllu file. If Token is multi, write span.
-		   Adopted from conllu.py.
+		   Adopted from conllu.py. The token is left unchanged, cleared and empty
+		   fields are written as `_`.
 		"""
-		s = ""
-		idx = str(self.index)
 		if self.multi:
 			return self._multi_str(clear_mor, clear_gra, clear_misc)
-		feats = 'None' if not self.feats or clear_mor else "|".join(self.feats)
 		if clear_mor:
-			self.lemma = 'None'
-			self.upos = 'None'
-			self.xpos = 'None'
-			self.feats = 'None'
+			lemma = upos = xpos = feats = None
+		else:
+			lemma, upos, xpos = self.lemma, self.upos, self.xpos
+			feats = "|".join(self.feats) if self.feats else None
 		if clear_gra:
-			self.head = 'None'
-			self.deprel = 'None'
-			self.deps = 'None'
-		if clear_misc:
-			self.misc = 'None'
-		s += f"{idx}\t{self.form}\t{self.lemma}\t{self.upos}\t{self.xpos}\t{feats}\t{self.head}\t{self.deprel}\t{self.deps}\t{self.misc}\n"
-		s = s.replace('None', '_')
-		return s
+			head = deprel = deps = None
+		else:
+			head, deprel, deps = self.head, self.deprel, self.deps
+		misc = None if clear_misc else self.misc
+		return _line(self.index, self.form, lemma, upos, xpos, feats, head, deprel, deps, misc)
 
 	def _multi_str(self, clear_mor=False, clear_gra=False, clear_misc=False):
-
-		s = ""
-
-		idx = "-".join((str(self.index), str(self.multi)))
-		form = self.form
-		fields = ['None', 'None', 'None', 'None', 'None', 'None', 'None']
-		misch = ['type=' + '^'.join(self.type) if self.type else 'None']
-		# misch = [f"type={t}" for t in self.type] if self.type else 'None'
-		if clear_misc:
-			misch = ['None']
-		s += "\t".join([idx, form] + fields + misch).replace('None', '_')
-
+		misc = 'type=' + '^'.join(self.type) if self.type and not clear_misc else '_'
+		lines = [f"{self.index}-{self.multi}\t{self.form or '_'}\t_\t_\t_\t_\t_\t_\t_\t{misc}\n"]
 		for n, i in enumerate(range(int(self.index), int(self.multi)+1)):
-
-			s += "\n"
-
-			# form = self.lemma[n]
-			# fields = [str(getattr(self, x)[n]) if x is not None else 'None' for x in self.__slots__[2:9]]
-			# s += "\t".join([str(i), form] + fields).replace('None', '_')
-			form=self.lemma[n]
+			form = self.lemma[n]
 			if clear_mor:
-				lemma = 'None'
-				upos = 'None'
-				xpos = 'None'
-				feats = 'None'
+				lemma = upos = xpos = feats = None
 			else:
-				lemma=self.lemma[n]
-				upos=self.upos[n] if self.upos else 'None'
-				xpos=self.xpos[n]
-				feats="|".join(self.feats[n]) if self.feats[n] else 'None'
+				lemma, upos, xpos, feats = form, _item(self.upos, n), _item(self.xpos, n), _item(self.feats, n)
+				feats = "|".join(feats) if feats else None
 			if clear_gra:
-				head = 'None'
-				deprel = 'None'
-				deps = 'None'
-			else:
-				if self.head is not None: head=self.head[n]
-				else: head='None'
-				if self.deprel: deprel=self.deprel[n]
-				else: deprel='None'
-				if self.deps: deps=self.deps[n]
-				else: deps='None'
-				# deps=self.deps[n] if self.deps[n] else 'None'
-			if clear_misc:
-				misc = 'None'
+				head = deprel = deps = None
 			else:
-				misc=self.misc[n] if self.misc[n] else 'None'
-			s += f"{str(i)}\t{form}\t{lemma}\t{upos}\t{xpos}\t{feats}\t{head}\t{deprel}\t{deps}\t{misc}"
-			# s += f"1{str(i)}\t2{form}\t3{lemma}\t4{upos}\t5{xpos}\t6{feats}\t7{head}\t8{deprel}\t9{deps}\t10{misc}"
-			# print(s)
-			s = s.replace('None', '_')
-		s+="\n"
-		return s
+				head, deprel, deps = _item(self.head, n), _item(self.deprel, n), _item(self.deps, n)
+			misc = None if clear_misc else _item(self.misc, n)
+			lines.append(_line(i, form, lemma, upos, xpos, feats, head, deprel, deps, misc))
+		return "".join(lines)
 
 	def add_misc(self, string):
 		if self.misc:
@@ -142,3 +101,16 @@ class Token(object):
 
 	def assign_ud_deprel(self, deprel):
 		self.deprel = deprel
+
+
+def _line(index, form, lemma, upos, xpos, feats, head, deprel, deps, misc):
+	"""One CoNLL-U line, with `_` for empty fields. Indices and heads may be
+	integers.
+	"""
+	return (f"{'_' if index is None else index}\t{form or '_'}\t{lemma or '_'}\t{upos or '_'}\t{xpos or '_'}\t"
+			f"{feats or '_'}\t{'_' if head is None else head}\t{deprel or '_'}\t{deps or '_'}\t{misc or '_'}\n")
+
+
+def _item(values, n):
+	"""The value of the n-th word of a multi-word token, None if unknown."""
+	return values[n] if values else None
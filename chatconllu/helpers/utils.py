@@ -1,20 +1,33 @@
 """Helpers.
 """
 import sys, os
-from typing import List, Tuple, Dict, Union
+from io import StringIO
+from typing import List, Tuple, Dict, Union, Iterable
 from pathlib import Path
+from helpers.archive import find_archive, list_members
 
-def list_files(directory: str, format="cha", filename="") -> List['pathlib.PosixPath']:
+def list_files(directory: str, format="cha", filename="", out_dir=None) -> List['pathlib.PosixPath']:
     """Recursively lists all files ending with the given format in the given directory.
 
     Parameters:
     -----------
     directory: The directory to recursively search for the files with the given format.
+               It can be a zip archive or a directory within one (see helpers.archive).
     format: The file format/extension to search for, only "cha" and "conllu" should
             be supplied.
     filename: If specified, matches the file with filename only.
+    out_dir: Where the outputs of files in a zip archive are written, defaults to
+             the directory of the archive.
 
-    Return value: A list of filepaths.
+    Return value: A list of filepaths, or of helpers.archive.ZipMember for archives.
+                  macOS metadata files (`._*`) are not listed.
 
     """
+    archive, inner = find_archive(directory)
+    if archive is not None:
+        return list_members(archive, inner, format, filename, out_dir)
     return [x for x in Path(directory).glob(f"**/*{filename}.{format}") if not x.name.startswith("._")]
+
+def as_lines(source: Union[str, Iterable[str]]) -> Iterable[str]:
+    """The lines of source, given as text or as an iterable of lines (e.g. an open file)."""
+    return StringIO(source) if isinstance(source, str) else source
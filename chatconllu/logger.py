@@ -1,11 +1,52 @@
+import atexit
 import logging
-from rich.logging import RichHandler
+from queue import SimpleQueue
+from logging.handlers import QueueHandler, QueueListener
 
 logger = logging.getLogger(__name__)
 
+
+class LazyRichHandler(logging.Handler):
+	"""A RichHandler created on the first record to emit, so that rich is
+	only imported once something is logged. It writes to stdout, or to
+	stderr if `stderr` is set before then.
+	"""
+
+	def __init__(self, level=logging.NOTSET):
+		super().__init__(level)
+		self.handler = None
+		self.stderr = False
+
+	def emit(self, record):
+		if self.handler is None:
+			from rich.console import Console
+			from rich.logging import RichHandler
+			self.handler = RichHandler(level=self.level, console=Console(stderr=self.stderr))
+		self.handler.emit(record)
+
+
+class LazyQueueHandler(QueueHandler):
+	"""A QueueHandler that starts the thread of `listener`, which handles the
+	records of the queue, on the first record to enqueue, so that no thread
+	is started on import.
+	"""
+
+	def __init__(self, queue, listener):
+		super().__init__(queue)
+		self.listener = listener
+		self.started = False
+
+	def enqueue(self, record):
+		if not self.started:  # called with the lock of the handler held
+			self.listener.start()
+			atexit.register(self.listener.stop)
+			self.started = True
+		super().enqueue(record)
+
+
 # handlers
-shell_handler = RichHandler()
-file_handler = logging.FileHandler("debug.log")
+shell_handler = LazyRichHandler()
+file_handler = logging.FileHandler("debug.log", delay=True)  # opened on the first record
 
 # formatter
 file_fmt = "%(levelname)s\t[%(asctime)s]\
@@ -23,5 +64,11 @@ logger.setLevel(logging.DEBUG)
 shell_handler.setLevel(logging.DEBUG)
 file_handler.setLevel(logging.DEBUG)
 
+# records are written to debug.log in a thread, started on the first record,
+# so that logging does not wait for the file
+file_queue = SimpleQueue()
+file_listener = QueueListener(file_queue, file_handler, respect_handler_level=True)
+queue_handler = LazyQueueHandler(file_queue, file_listener)
+
 logger.addHandler(shell_handler)
-logger.addHandler(file_handler)
+logger.addHandler(queue_handler)
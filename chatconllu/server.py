@@ -0,0 +1,165 @@
+"""
+A local conversion server for tools that convert one utterance or one
+file at a time. It keeps the converters loaded and the segment and
+utterance caches warm across requests:
+
+	POST /chat2conllu[?variant=NAME]                CHAT text -> CoNLL-U text
+	POST /conllu2chat[?new-mor&new-gra&cnl&pos]     CoNLL-U text -> CHAT text
+	GET  /stats                                     throughput, latency and cache statistics as JSON
+
+Request and response bodies are UTF-8 text; a CHAT body may be a single
+utterance with its dependent tiers. Requests are handled one at a time.
+"""
+import json
+import time
+import argparse
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from logger import logger
+from helpers.cache import LRUCache
+import chatparser
+import conlluparser
+
+LATENCIES = 1000  # most recent requests the latency percentiles are computed on
+
+
+class Stats(object):
+	"""Request counts, sizes and latencies of an endpoint."""
+
+	__slots__ = ['requests',
+				 'errors',
+				 'seconds',
+				 'bytes_in',
+				 'bytes_out',
+				 'latencies',
+				 ]
+
+	def __init__(self):
+		self.requests = 0
+		self.errors = 0
+		self.seconds = 0.0
+		self.bytes_in = 0
+		self.bytes_out = 0
+		self.latencies = deque(maxlen=LATENCIES)
+
+	def add(self, seconds, bytes_in, bytes_out, error=False):
+		self.requests += 1
+		self.errors += error
+		self.seconds += seconds
+		self.bytes_in += bytes_in
+		self.bytes_out += bytes_out
+		self.latencies.append(seconds)
+
+	def info(self):
+		latencies = sorted(self.latencies)
+
+		def ms(q):
+			return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3) if latencies else None
+
+		return {'requests': self.requests,
+				'errors': self.errors,
+				'requests_per_s': round(self.requests / self.seconds, 1) if self.seconds else None,
+				'bytes_in': self.bytes_in,
+				'bytes_out': self.bytes_out,
+				'latency_ms': {'mean': round(self.seconds / self.requests * 1000, 3) if self.requests else None,
+							   'p50': ms(0.5),
+							   'p95': ms(0.95),
+							   'max': ms(1.0),
+							   },
+				}
+
+
+class ConversionServer(HTTPServer):
+	"""An HTTPServer holding the utterance cache and the statistics of the
+	conversions it serves.
+	"""
+
+	def __init__(self, address, cache_size=10000):
+		super().__init__(address, ConversionHandler)
+		self.cache = LRUCache(cache_size) if cache_size > 0 else None
+		self.stats = {'chat2conllu': Stats(), 'conllu2chat': Stats()}
+		self.started = time.time()
+
+	def convert(self, endpoint, query, text):
+		if endpoint == 'chat2conllu':
+			variant = query.get('variant', ['full'])[-1].replace(' ', '+')  # an unescaped '+' reads as a space
+			_, clear_mor, clear_gra, clear_misc = chatparser.parse_variant(variant)
+			return chatparser.chat2conllu_text(text, clear_mor, clear_gra, clear_misc, self.cache)
+		return conlluparser.conllu2chat_text(text, 'new-mor' in query, 'new-gra' in query, 'cnl' in query, 'pos' in query)
+
+	def info(self):
+		segments = chatparser.segment_cache_info()
+		return {'uptime_s': round(time.time() - self.started, 1),
+				'endpoints': {k: v.info() for k, v in self.stats.items()},
+				'utterance_cache': self.cache.info() if self.cache is not None else None,
+				'segment_cache': {'hits': sum(c.hits for c in segments.values()),
+								  'misses': sum(c.misses for c in segments.values()),
+								  },
+				}
+
+
+class ConversionHandler(BaseHTTPRequestHandler):
+
+	def reply(self, status, body, content_type='text/plain; charset=utf-8'):
+		data = body.encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+		return len(data)
+
+	def do_GET(self):
+		if urlsplit(self.path).path.strip('/') != 'stats':
+			self.reply(404, "not found\n")
+			return
+		self.reply(200, json.dumps(self.server.info(), indent=2) + "\n", 'application/json')
+
+	def do_POST(self):
+		url = urlsplit(self.path)
+		endpoint = url.path.strip('/')
+		stats = self.server.stats.get(endpoint)
+		if stats is None:
+			self.reply(404, "not found\n")
+			return
+		start = time.perf_counter()
+		data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		try:
+			status, body = 200, self.server.convert(endpoint, parse_qs(url.query, keep_blank_values=True), data.decode('utf-8'))
+		except Exception as e:
+			logger.exception(f"failed to convert a {endpoint} request")
+			status, body = (400 if isinstance(e, ValueError) else 500), f"{type(e).__name__}: {e}\n"
+		size = self.reply(status, body)
+		stats.add(time.perf_counter() - start, len(data), size, status != 200)
+
+	def log_message(self, format, *args):
+		logger.debug(f"{self.address_string()} {format % args}")
+
+
+def main():
+	argp = argparse.ArgumentParser(description="Serve conversions between CHAT and CoNLL-U over HTTP on this machine.")
+	argp.add_argument("--host", default="127.0.0.1", help="address to listen on")
+	argp.add_argument("--port", type=int, default=8571, help="port to listen on")
+	argp.add_argument(
+		"--cache",
+		type=int,
+		default=10000,
+		help="number of distinct utterances whose conversion is kept across requests, 0 disables the cache")
+	argp.add_argument("--log-level", type=str.upper, default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+	args = argp.parse_args()
+	logger.setLevel(args.log_level)
+
+	server = ConversionServer((args.host, args.port), args.cache)
+	logger.warning(f"serving on http://{args.host}:{server.server_port}/")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+
+
+if __name__ == "__main__":
+	main()
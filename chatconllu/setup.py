@@ -4,5 +4,5 @@ setup(
     name="chatconllu",
     version="0.0.1",
     packages=find_namespace_packages(),
-    entry_points={"console_scripts": ["chatconllu=cli:main"]},
+    entry_points={"console_scripts": ["chatconllu=cli:main", "chatconllu-server=server:main"]},
 )
@@ -0,0 +1,25 @@
+"""Keep test runs from writing into the working tree: debug.log and the
+CHAT files of conllu2chat go to temporary directories.
+"""
+import pytest
+
+import logger
+import conlluparser
+
+
+@pytest.fixture(autouse=True, scope="session")
+def debug_log(tmp_path_factory):
+    handler = logger.file_handler
+    handler.acquire()
+    try:
+        if handler.stream is not None:
+            handler.stream.close()
+            handler.stream = None
+        handler.baseFilename = str(tmp_path_factory.mktemp("log") / "debug.log")  # opened on the next record
+    finally:
+        handler.release()
+
+
+@pytest.fixture(autouse=True)
+def out_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(conlluparser, "_OUT_DIR", tmp_path / "out")
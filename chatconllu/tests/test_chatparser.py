@@ -1,5 +1,13 @@
+import time
+from io import StringIO
+import shutil
+from pathlib import Path
 import pytest
 from chatconllu import chatparser
+from helpers.clean_utterance import delete_prev
+from helpers.manifest import Manifest
+from helpers.pipeline import run_pipeline
+from helpers.conllu import iter_conllu, encode_tier, decode_tier
 
 @pytest.mark.parametrize("form, toks",
                     [
@@ -81,3 +89,578 @@ def test_check_token_all(surface, clean):
                         ])
 def test_to_upos(mor_code, upos):
     assert chatparser.to_upos(mor_code) == upos
+
+
+def test_iter_chat():
+    lines = ["@Begin\n",
+             "*CHI:\tmore\n",
+             "\tcookie .\n",
+             "%mor:\tqn|more n|cookie .\n",
+             "@Comment:\tbreak\n",
+             "*MOT:\t0 .\n",
+             "@End\n"]
+    final = []
+    blocks = chatparser.iter_chat(iter(lines), final)
+    assert next(blocks) == (["@Begin"], ["*CHI:\tmore cookie .", "%mor:\tqn|more n|cookie ."])
+    assert final == []  # not read yet
+    assert list(blocks) == [(["@Comment:\tbreak"], ["*MOT:\t0 ."])]
+    assert final == ["@End"]
+
+
+@pytest.fixture
+def create_sentence_calls(monkeypatch):
+    """The indices chatparser.create_sentence() is called with, in order."""
+    calls = []
+    create_sentence = chatparser.create_sentence
+    def counting(idx, lines, cache=None):
+        calls.append(idx)
+        return create_sentence(idx, lines, cache)
+    monkeypatch.setattr(chatparser, "create_sentence", counting)
+    return calls
+
+
+def test_to_conllu_converts_once(tmp_path, create_sentence_calls):
+    lines = ["@Begin\n",
+             "*CHI:\tmore cookie .\n",
+             "*MOT:\t0 .\n",
+             "*CHI:\tcookie .\n",
+             "*MOT:\t0 .\n",
+             "%com:\tnods\n",
+             "@End\n"]
+    calls = create_sentence_calls
+    final = []
+    fn = tmp_path / "test.conllu"
+    chatparser.to_conllu(fn, chatparser.iter_chat(iter(lines), final), final)
+    assert calls == [0, 1, 2, 3]
+    comments = [l for l in fn.read_text(encoding="utf-8").splitlines() if l.startswith("# ")]
+    assert comments == [
+        "# @Begin",
+        "# tier_encoding = raw",
+        "# final = ['@End']",
+        "# final_sents = ['# final_com_1 = nods\\n', '# final_MOT_1 = 0 .\\n']",
+        "# sent_id = 1",
+        "# text = more cookie .",
+        "# chat_sent = more cookie .",
+        "# speaker = CHI",
+        "# final_MOT_1 = 0 .",
+        "# final_com_1 = nods",
+        "# empty_speaker = MOT",
+        "# empty_chat_sent = 0 .",
+        "# sent_id = 3",
+        "# text = cookie .",
+        "# chat_sent = cookie .",
+        "# speaker = CHI",
+        ]
+
+
+def test_create_sentence_cache():
+    cache = chatparser.LRUCache(maxsize=1)
+    yeah = ["*MOT:\tyeah .", "%mor:\tco|yeah ."]
+    first = chatparser.create_sentence(0, yeah, cache)
+    again = chatparser.create_sentence(1, ["*CHI:\tyeah .", "%mor:\tco|yeah ."], cache)
+    assert (again.speaker, again.sent_id) == ("CHI", 2)
+    assert (first.speaker, first.sent_id) == ("MOT", 1)
+    assert again.toks is first.toks
+    chatparser.create_sentence(2, ["*CHI:\tno ."], cache)
+    assert (cache.hits, cache.misses, cache.evictions) == (1, 2, 1)
+
+
+def test_segment_decoding_is_immutable():
+    pos, lemma, feats, misc = chatparser.get_lemma_and_feats("n|dog-PL")
+    assert (pos, lemma, feats, misc) == ("n", "dog", ("Number=Plur",), "feats=-PL")
+    assert isinstance(chatparser.get_lemma_and_feats("pro:sub|I~mod|will", is_multi=True), tuple)
+    lines = ["*MOT:\tSarah , what's that ?",
+             "%mor:\tn:prop|Sarah cm|cm pro:int|what~cop|be&3S pro:dem|that ?",
+             "%gra:\t1|4|BEG 2|1|BEGP 3|4|ATTR 4|0|ROOT 5|4|SUBJ 6|4|PUNCT"]
+    first = chatparser.create_sentence(0, lines).conllu_str()
+    assert chatparser.create_sentence(0, lines).conllu_str() == first
+
+
+def test_conllu_str_is_immutable():
+    lines = ["*MOT:\tNone , what's that ?",
+             "%mor:\tn:prop|None cm|cm pro:int|what~cop|be&3S pro:dem|that ?",
+             "%gra:\t1|4|BEG 2|1|BEGP 3|4|ATTR 4|0|ROOT 5|4|SUBJ 6|4|PUNCT"]
+    sent = chatparser.create_sentence(0, lines)
+    full = sent.conllu_str()
+    assert full.startswith("1\tNone\tNone\tPROPN\tn:prop\t_\t_\tvocative\t_:vocative\tgr=beg|head=4\n")
+    assert "3-4\twhat's\t_\t_\t_\t_\t_\t_\t_\ttype=~\n" in full
+    bare = sent.conllu_str(clear_mor=True, clear_gra=True, clear_misc=True)
+    assert bare.splitlines()[0] == "1\tNone\t_\t_\t_\t_\t_\t_\t_\t_"
+    assert bare.splitlines()[2] == "3-4\twhat's\t_\t_\t_\t_\t_\t_\t_\t_"
+    assert sent.conllu_str() == full
+
+
+@pytest.mark.parametrize("line",
+                        [
+                        "yeah .",
+                        "what's that ?",
+                        "Sarah , what's that ?",
+                        "0is gonna hug@o her xxx &=laughs ‡ .",
+                        "乖乖 狗 卡儿 .",
+                        "a  b .",
+                        "tic-tac-toe .",
+                        "Urs(u)la's coffee .",  # not plain
+                        "well, okay .",  # not plain
+                        "yeah : yeah .",  # not plain
+                        "",
+                        ])
+def test_normalise_utterance_fast_path(line):
+    assert chatparser.normalise_utterance(line) == chatparser.normalise_utterance(line, fast=False)
+
+
+@pytest.mark.parametrize("line",
+                        [
+                        "<her gonna> [/?] he 0is gonna hug her [^ ns] .",
+                        "I [x 3] [//] oh ‡ I hafta look for the sun (.) sun (.) nope .",
+                        "pop@o goes the measle [: weasel][* sem] .",
+                        "tam [:: some][:: asdf] more [: moore] .",
+                        "<do you want> [<] [>] [/] do you wanna go on a bike ?",
+                        "<and I will> [?] [//] (.) and I was +...",
+                        "when it's one it's “man (.)” and when there're two (.) it's +...",
+                        "der [: the] [//] this do this (12.) .",
+                        "yeah [>] .",
+                        "<a <b c> [//] d> [/] e .",
+                        "b [: c ] [//] d",
+                        "x [:: a ] [/]",
+                        "<a b> [: c ] [//] d",
+                        "a [: b ] [/] <c d> [:: e ] [//] f .",
+                        ])
+def test_normalise_utterance_engine(line):
+    assert chatparser.normalise_utterance(line) == chatparser.normalise_utterance(line, fast=False)
+
+
+@pytest.mark.parametrize("line, toks",
+                        [
+                        ("b [: c ] [//] d", ['c', 'd']),
+                        ("x [:: a ] [/]", ['a']),
+                        ("x [:: a ] [/] y", ['a', 'y']),
+                        ("a b [: c ] [/] d", ['a', 'c', 'd']),
+                        ("a [: b c ] [//] e .", ['b', 'c', 'e', '.']),
+                        ("a [:: b ] [/] c [: d ] [//] e .", ['b', 'd', 'e', '.']),
+                        ("b [: c] [//] d", ['d']),
+                        ])
+def test_normalise_utterance_replace_then_retrace(line, toks):
+    # a replacement ending in " ]" leaves an empty token, which stops a retrace
+    assert chatparser.normalise_utterance(line)[0] == toks
+    assert chatparser.normalise_utterance(line, fast=False)[0] == toks
+
+
+def test_normalise_utterance_deep_retracing():
+    n = 5000  # deeper than the recursion limit
+    line = "<a " * n + "b" + "> [/] c" * n + " ."
+    assert chatparser.normalise_utterance(line)[0] == ['c', '.']
+    assert chatparser.normalise_utterance("dog [: cat] [//] " * n + "the end .")[0] == ['the', 'end', '.']
+
+
+@pytest.mark.parametrize("near_miss",
+                        [
+                        "[= " + "a" * 20000 + "!",
+                        "[% " + "a" * 10000 + " " + "b" * 10000 + "] [/x",
+                        ])
+def test_delete_prev_near_miss(near_miss):
+    start = time.perf_counter()
+    assert delete_prev.match(near_miss) is None
+    assert time.perf_counter() - start < 0.5
+
+
+def test_dependency_index():
+    Token = chatparser.Token
+    tokens = [Token(index=1, form='Mommy', upos='PROPN', head='3', deprel='beg'),
+              Token(index=2, form='I', upos='PRON', head='3', deprel='subj'),
+              Token(index=3, form='want', upos='VERB', head='0', deprel='root'),
+              Token(index=4, form="it's", upos=['PRON', 'AUX'], head=['3', '4'], deprel=['obj', 'cop'], multi=5),
+              Token(index=6, form='.', upos='PUNCT', head='3', deprel='punct'),
+              ]
+    dep_index = chatparser.DependencyIndex(tokens)
+    assert dep_index.heads == [None, 3, 3, 0, 3, 4, 3]
+    assert dep_index.children == [[3], [], [], [1, 2, 4, 6], [5], [], []]
+    assert dep_index.upos[4:6] == ['PRON', 'AUX']
+    assert dep_index.root() == 3
+
+    dep_index = chatparser.DependencyIndex([Token(index=1, form='Mommy', upos='PROPN', head='2', deprel='beg'),
+                                            Token(index=2, form='come', upos='VERB', head='4', deprel='comp'),
+                                            Token(index=3, form='here', upos='ADV', head='2', deprel='jct'),
+                                            Token(index=4, form='go', upos='VERB', head='0', deprel='root'),
+                                            ])
+    chatparser.change_head_to_root(dep_index.tokens[0], dep_index)
+    assert dep_index.heads == [None, 4, 4, 2, 0]
+    assert dep_index.children == [[4], [], [3], [], [1, 2]]
+    assert dep_index.tokens[0].head == 4 and dep_index.tokens[0].misc == 'head=2'
+
+    n = 1000  # beg-heavy utterance
+    tokens = [Token(index=i, form='Mommy', upos='PROPN', head=str(n + 1), deprel='beg') for i in range(1, n + 1)]
+    tokens.append(Token(index=n + 1, form='go', upos='VERB', head='0', deprel='root'))
+    chatparser.to_ud_values(tokens)
+    assert all(tok.head == n + 1 and tok.deprel == 'vocative' for tok in tokens[:-1])
+
+
+@pytest.mark.parametrize("jobs, pipeline", [(2, 0), (1, 2)])
+def test_chat2conllu_jobs(tmp_path, jobs, pipeline):
+    sample = Path(__file__).parent / "07.cha"
+    outputs = {}
+    for run in ("sequential", "parallel"):
+        d = tmp_path / run
+        d.mkdir()
+        files = [d / f"{i}.cha" for i in range(3)]
+        for f in files:
+            shutil.copy(sample, f)
+        if run == "sequential":
+            chatparser.chat2conllu(files)
+        elif jobs > 1:
+            (d / "broken.cha").mkdir()  # cannot be opened, must not stop the others
+            chatparser.chat2conllu(files + [d / "broken.cha"], jobs=jobs)
+        else:
+            chatparser.chat2conllu(files, pipeline=pipeline)
+        outputs[run] = [f.read_bytes() for f in sorted(d.glob("*.conllu"))]
+    assert len(outputs["sequential"]) == 3
+    assert outputs["sequential"] == outputs["parallel"]
+
+
+def test_chat2conllu_jobs_single_failure(tmp_path):
+    (tmp_path / "broken.cha").mkdir()  # cannot be opened
+    chatparser.chat2conllu([tmp_path / "broken.cha"], jobs=2)  # reported, not raised
+    with pytest.raises(IsADirectoryError):
+        chatparser.chat2conllu([tmp_path / "broken.cha"], jobs=1)
+
+
+def test_chat2conllu_incremental(tmp_path, monkeypatch):
+    files = [tmp_path / f"{i}.cha" for i in range(2)]
+    for f in files:
+        shutil.copy(Path(__file__).parent / "07.cha", f)
+    converted = []
+    convert = chatparser.chat_file2conllu
+    def counting(f, *args):
+        converted.append(f.name)
+        return convert(f, *args)
+    monkeypatch.setattr(chatparser, "chat_file2conllu", counting)
+
+    def run(**flags):
+        converted.clear()
+        chatparser.chat2conllu(files, manifest=Manifest(tmp_path), **flags)
+        return sorted(converted)
+
+    assert run() == ["0.cha", "1.cha"]
+    assert run() == []
+    with open(files[1], "a", encoding="utf-8") as fp:
+        fp.write("@Comment:\tcorrected\n")
+    assert run() == ["1.cha"]
+    assert run(clear_mor=True) == ["0.cha", "1.cha"]
+    files[0].with_suffix(".conllu").unlink()
+    assert run(clear_mor=True) == ["0.cha"]
+
+
+def test_chat2conllu_variants(tmp_path, create_sentence_calls):
+    f = tmp_path / "0.cha"
+    shutil.copy(Path(__file__).parent / "07.cha", f)
+    names = ["full", "no-mor", "no-gra+no-misc"]
+    expected = {}
+    for name in names:
+        chatparser.chat2conllu([f], *chatparser.parse_variant(name)[1:])
+        expected[name] = f.with_suffix(".conllu").read_bytes()
+    f.with_suffix(".conllu").unlink()
+
+    calls = create_sentence_calls
+    calls.clear()
+    chatparser.chat2conllu([f], variants=[chatparser.parse_variant(name) for name in names])
+    assert len(calls) == len(set(calls))
+    assert (tmp_path / "0.conllu").read_bytes() == expected["full"]
+    assert (tmp_path / "0.no-mor.conllu").read_bytes() == expected["no-mor"]
+    assert (tmp_path / "0.no-gra+no-misc.conllu").read_bytes() == expected["no-gra+no-misc"]
+    with pytest.raises(ValueError):
+        chatparser.parse_variant("no-pos")
+
+
+def test_to_conllu_delta(tmp_path, create_sentence_calls):
+    lines = (Path(__file__).parent / "07.cha").read_text(encoding="utf-8").splitlines(keepends=True)
+    calls = create_sentence_calls
+
+    def convert(to_conllu, lines, fn):
+        calls.clear()
+        final = []
+        to_conllu(fn, chatparser.iter_chat(iter(lines), final), final)
+        return fn.read_bytes()
+
+    fn = tmp_path / "delta.conllu"
+    assert convert(chatparser.to_conllu_delta, lines, fn) == convert(chatparser.to_conllu, lines, tmp_path / "full.conllu")
+    assert convert(chatparser.to_conllu_delta, lines, fn) == (tmp_path / "full.conllu").read_bytes()
+    assert calls == []  # nothing changed
+
+    first = next(i for i, l in enumerate(lines) if l.startswith("*"))
+    lines.insert(first, "*CHI:\tmore cookie .\n")  # shifts all sent_ids
+    delta = convert(chatparser.to_conllu_delta, lines, fn)
+    assert calls == [0]
+    assert delta == convert(chatparser.to_conllu, lines, tmp_path / "full.conllu")
+
+
+def test_only_empty_utterances(tmp_path):
+    import conlluparser
+    chat = ("@UTF8\n@Begin\n@Participants:\tCHI Target_Child\n"
+            "*CHI:\t0 .\n%com:\tsilent\n*MOT:\t0 [=! laughs] .\n@End\n")
+    conllu = chatparser.chat2conllu_text(chat)
+    assert "# final_CHI_2 = 0 .\n" in conllu
+    assert conlluparser.conllu2chat_text(conllu) == chat
+    final = []
+    streamed = "".join(chatparser.iter_conllu_text(chatparser.iter_chat(iter(chat.splitlines(keepends=True)), final), final))
+    assert streamed == conllu
+    fn = tmp_path / "0.conllu"
+    for _ in range(2):  # written, then copied from the previous output
+        final = []
+        chatparser.to_conllu_delta(fn, chatparser.iter_chat(iter(chat.splitlines(keepends=True)), final), final)
+        assert fn.read_text(encoding="utf-8") == conllu
+
+
+def test_run_pipeline_overlaps_and_keeps_order():
+    written = []
+    def read(f):
+        time.sleep(0.02)
+        return f * 2
+    def convert(f, data):
+        time.sleep(0.02)
+        return data + 1
+    start = time.perf_counter()
+    run_pipeline(range(10), convert, lambda f, r: written.append((f, r)), depth=2, read=read)
+    assert written == [(f, f * 2 + 1) for f in range(10)]
+    assert time.perf_counter() - start < 0.35  # reads overlap conversions, 0.4 s in sequence
+
+    def failing(f, data):
+        if f == 3:
+            raise ValueError(f)
+        return data
+    written.clear()
+    with pytest.raises(ValueError):
+        run_pipeline(range(10), failing, lambda f, r: written.append(f), depth=2, read=read)
+    assert written == [0, 1, 2]
+
+
+def test_iter_conllu():
+    lines = ["# @Begin\n",
+             "# sent_id = 1\n",
+             "# chat_sent = it's a = b\n",
+             "# text =\n",
+             "1-2\tit's\t_\t_\t_\t_\t_\t_\t_\ttype=~\n",
+             "1\tit\tit\tPRON\tpro:per\t_\t2\tnsubj\t2:nsubj\tgr=subj|form=a,b|x\n",
+             "2\tis\tbe\tAUX\tcop\t_\t0\troot\t0:root\t_\n",
+             "\n",
+             "\n",
+             "# sent_id = 2\n"]
+    first, second = iter_conllu(iter(lines))
+    assert list(first.meta.items()) == [("@Begin", None), ("sent_id", "1"), ("chat_sent", "it's a = b"), ("text =", None)]
+    assert [t.id for t in first] == ["1-2", "1", "2"]
+    mwt, it, be = first
+    assert mwt.is_multiword() and (mwt.form, mwt.lemma, mwt.head) == ("it's", None, None)
+    assert it.misc == {"gr": ["subj"], "form": ["a", "b"], "x": None}
+    assert be.misc == {}
+    assert (second.id, second.tokens) == ("2", [])
+
+
+@pytest.mark.parametrize("text, value",
+                        [
+                        ("qn|more n|cookie .", "qn|more n|cookie ."),
+                        ("", '""'),
+                        ("  padded", '"  padded"'),
+                        ('"quoted" and = sign', '"\\"quoted\\" and = sign"'),
+                        ])
+def test_encode_tier(text, value):
+    assert encode_tier(text) == value
+    assert decode_tier(value) == text
+
+
+def test_to_cha_reads_both_tier_encodings():
+    import conlluparser
+    tokens = "1\tmore\tmore\tDET\tqn\t_\t_\t_\t_\t_\n2\tcookie\tcookie\tNOUN\tn\t_\t_\t_\t_\t_\n"
+    old = ("# @Begin\n# final = ['@End']\n# sent_id = 1\n# chat_sent = more cookie\n# speaker = CHI\n"
+           "# mor = ['qn|more', 'n|cookie']\n# com = ['', 'padded']\n" + tokens)
+    new = ("# @Begin\n# tier_encoding = raw\n# final = ['@End']\n# sent_id = 1\n# chat_sent = more cookie\n# speaker = CHI\n"
+           "# mor = qn|more n|cookie\n# com = \" padded\"\n" + tokens)
+    outputs = []
+    for text in (old, new):
+        out = StringIO()
+        conlluparser.to_cha(out, iter_conllu(StringIO(text)))
+        outputs.append(out.getvalue())
+    assert outputs[0] == outputs[1] == "@Begin\n*CHI:\tmore cookie\n%mor:\tqn|more n|cookie\n%com:\t padded\n@End\n"
+
+
+def test_construct_tiers():
+    import conlluparser
+    lines = ["1-2\tit's\t_\t_\t_\t_\t_\t_\t_\t_\n",
+             "1\tit\tit\tPRON\tpro:per\t_\t2\tnsubj\t_\tgr=subj\n",
+             "2\tis\tbe\tAUX\tcop\tMood=Ind\t0\troot\t_\tgr=root|feats=&3S\n",
+             "3\t.\t.\tPUNCT\tpunct\t_\t2\tpunct\t_\tgr=punct\n"]
+    sent, = iter_conllu(iter(lines))
+    assert conlluparser.has_tiers(sent) == (True, True)
+    mor, gra, cnl, pos = conlluparser.construct_tiers(sent, True, True, generate_cnl=True, generate_pos=True)
+    assert mor == ["pro:per|it~cop|be&3S", "."]
+    assert gra == ["1|2|SUBJ", "2|0|ROOT", "3|2|PUNCT"]
+    assert cnl == ["1|2|nsubj", "2|0|root", "3|2|punct"]
+    assert pos == ["pron|it~aux|be", "punct|."]
+    mor, gra, cnl, pos = conlluparser.construct_tiers(sent, True, True, generate_mor=True, generate_gra=True)
+    assert (mor, gra, cnl, pos) == (["_|_~_|_", "."], ["1|_|_", "2|_|_", "3|_|_"], [], [])
+
+
+def test_diagnostics():
+    from helpers import diagnostics
+    diagnostics.begin_file("a.cha")
+    for sent in (1, 2, 2):
+        diagnostics.at(sent)
+        diagnostics.note('deprel', 'xyz')
+    diagnostics.note('upos', 'abc')
+    tally = diagnostics.end_file()
+    assert tally.counts == {('deprel', 'xyz'): 3, ('upos', 'abc'): 1}
+    assert tally.first == {('deprel', 'xyz'): ("a.cha", 1), ('upos', 'abc'): ("a.cha", 2)}
+    diagnostics.merge(tally)
+    diagnostics.merge(tally)
+    run = diagnostics.end_run()
+    assert (run.total(), len(run)) == (8, 2)
+    assert run.table(1) == "6  xyz does not have a corresponding deprel in GR2DEPREL.  (first: a.cha, sent 1)\n... and 1 more"
+    assert not diagnostics.end_run()
+
+
+def test_diagnostics_of_cached_conversions():
+    # memoized decoders and cached utterances count what they noted on every use
+    from helpers.cache import LRUCache
+    f = Path(__file__).parent / "07.cha"
+    first = chatparser.chat_file2conllu(f, out=StringIO())
+    assert first.counts[('upos', 'sfp')] == 27
+    assert chatparser.chat_file2conllu(f, out=StringIO()).counts == first.counts
+    assert chatparser.chat_file2conllu(f, out=StringIO(), cache=LRUCache(10000)).counts == first.counts
+
+
+STARTUP_BUDGET = 0.5  # seconds, generous for slow machines; importing cli takes ~0.05 s
+
+
+@pytest.mark.parametrize("module, unused",
+                        [
+                        ("cli", ["chatparser", "conlluparser", "rich", "multiprocessing", "pyconll", "zipfile", "tarfile"]),
+                        ("chatparser", ["conlluparser", "rich", "multiprocessing", "pyconll", "zipfile", "tarfile", "helpers.pool", "helpers.pipeline", "helpers.manifest"]),
+                        ("conlluparser", ["chatparser", "rich", "multiprocessing", "pyconll", "zipfile", "tarfile", "helpers.pool", "helpers.pipeline", "helpers.manifest"]),
+                        ])
+def test_startup(tmp_path, module, unused):
+    from benchmarks.bench_startup import import_times
+    times = import_times(module, tmp_path)
+    assert times[module][1] / 1e6 < STARTUP_BUDGET
+    assert not [m for m in unused if m in times]
+    assert not list(tmp_path.iterdir())  # no debug.log, no tests/out
+
+
+def test_server():
+    import json
+    import threading
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+    import server
+    httpd = server.ConversionServer(("127.0.0.1", 0), cache_size=10)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{httpd.server_port}"
+    try:
+        chat = "*CHI:\tmore cookie .\n%mor:\tqn|more n|cookie .\n%gra:\t1|2|QUANT 2|0|INCROOT 3|2|PUNCT\n"
+        for _ in range(2):
+            conllu = urlopen(f"{url}/chat2conllu", chat.encode("utf-8")).read().decode("utf-8")
+        assert "2\tcookie\tcookie\tNOUN\tn\t_\t0\troot\t0:root\tgr=incroot\n" in conllu
+        bare = urlopen(f"{url}/chat2conllu?variant=no-mor+no-gra+no-misc", chat.encode("utf-8")).read().decode("utf-8")
+        assert "2\tcookie\t_\t_\t_\t_\t_\t_\t_\t_\n" in bare
+        assert urlopen(f"{url}/conllu2chat", conllu.encode("utf-8")).read().decode("utf-8") == chat
+        with pytest.raises(HTTPError) as e:
+            urlopen(f"{url}/chat2conllu?variant=nope", chat.encode("utf-8"))
+        assert e.value.code == 400
+        stats = json.loads(urlopen(f"{url}/stats").read())
+        assert stats["endpoints"]["chat2conllu"]["requests"] == 4
+        assert stats["endpoints"]["chat2conllu"]["errors"] == 1
+        assert stats["endpoints"]["conllu2chat"]["requests"] == 1
+        assert stats["utterance_cache"]["hits"] == 2
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@pytest.mark.parametrize("flags", [(False, False, False), (True, False, True)])
+def test_text_api(flags):
+    import conlluparser
+    f = Path(__file__).parent / "07.cha"
+    out = StringIO()
+    chatparser.chat_file2conllu(f, *flags, out=out)
+    text = chatparser.chat2conllu_text(f.read_text(encoding="utf-8"), *flags)
+    assert text == out.getvalue()
+    with open(f, encoding="utf-8") as fp:
+        assert chatparser.chat2conllu_text(fp, *flags) == text
+    sents = list(chatparser.iter_sentences(f.read_text(encoding="utf-8")))
+    assert text.count("# chat_sent = ") == len(sents) - sum(s.text() in chatparser.EMPTY for s in sents)
+    cha = StringIO()
+    conlluparser.to_cha(cha, iter_conllu(StringIO(text)))
+    chunks = list(conlluparser.iter_conllu2chat(text.splitlines(keepends=True)))
+    assert len(chunks) > 1 and "".join(chunks) == conlluparser.conllu2chat_text(text) == cha.getvalue()
+
+
+def test_stream(tmp_path):
+    import os
+    import subprocess
+    import sys
+    import conlluparser
+    root = Path(__file__).resolve().parents[1]
+    f = root / "tests" / "07.cha"
+    env = dict(os.environ, PYTHONPATH=str(root))
+
+    def run(*args, data):
+        return subprocess.run([sys.executable, str(root / "cli.py"), *args], input=data, cwd=tmp_path, env=env,
+                              capture_output=True, check=True).stdout.decode("utf-8")
+
+    conllu = run("-", "--no-misc", data=f.read_bytes())
+    assert conllu.startswith("# @UTF8\n") and "\tgr=" not in conllu
+    assert conllu.count("\n\n") == chatparser.chat2conllu_text(f.read_text(encoding="utf-8"), False, False, True).count("\n\n")
+    expected = conlluparser.conllu2chat_text(chatparser.chat2conllu_text(f.read_text(encoding="utf-8")))
+    assert run("-f", "conllu", "-", data=run("-", data=f.read_bytes()).encode("utf-8")) == expected
+    assert [p.name for p in tmp_path.iterdir()] == ["debug.log"]  # no other output than the log
+    assert run("-", "--variant", "no-misc", data=f.read_bytes()) == conllu
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        run("-", "--variant", "full", "--variant", "no-mor", data=f.read_bytes())
+    assert b"only one --variant" in e.value.stderr
+
+
+def test_zip_corpus(tmp_path):
+    import zipfile
+    from helpers.utils import list_files
+    from helpers.archive import ZipMember
+    with zipfile.ZipFile(tmp_path / "Corpus.zip", "w") as zf:
+        zf.write(Path(__file__).parent / "07.cha", "Corpus/Child/07.cha")
+        zf.writestr("__MACOSX/Corpus/Child/._07.cha", "")
+    assert list_files(tmp_path / "Corpus.zip" / "Other") == []
+    files = list_files(tmp_path / "Corpus.zip" / "Corpus", out_dir=tmp_path / "out")
+    assert files == [ZipMember(tmp_path / "Corpus.zip", "Corpus/Child/07.cha", tmp_path / "out")]
+    chatparser.chat2conllu(files, jobs=1, manifest=Manifest(tmp_path / "out"))
+    expected = StringIO()
+    chatparser.chat_file2conllu(Path(__file__).parent / "07.cha", out=expected)
+    assert (tmp_path / "out" / "Corpus" / "Child" / "07.conllu").read_text(encoding="utf-8") == expected.getvalue()
+
+
+@pytest.mark.parametrize("name, jobs", [("out.tar.gz", 1), ("out.zip", 2)])
+def test_archive_sink(tmp_path, name, jobs):
+    import tarfile
+    import zipfile
+    from helpers.archive import ArchiveSink
+    files = []
+    for child in ["a", "b"]:
+        (tmp_path / "corpus" / child).mkdir(parents=True)
+        files.append(Path(shutil.copy(Path(__file__).parent / "07.cha", tmp_path / "corpus" / child)))
+    with ArchiveSink(tmp_path / name, tmp_path) as sink:
+        chatparser.chat2conllu(files, jobs=jobs, sink=sink)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["corpus", name]
+    assert not list(tmp_path.glob("corpus/*/*.conllu"))
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(tmp_path / name) as zf:
+            members = {n: zf.read(n).decode("utf-8") for n in zf.namelist()}
+    else:
+        with tarfile.open(tmp_path / name) as tf:
+            members = {m.name: tf.extractfile(m).read().decode("utf-8") for m in tf.getmembers()}
+    expected = StringIO()
+    chatparser.chat_file2conllu(files[0], out=expected)
+    assert members == {"corpus/a/07.conllu": expected.getvalue(), "corpus/b/07.conllu": expected.getvalue()}
+
+    with pytest.raises(ZeroDivisionError), ArchiveSink(tmp_path / "failed.tar", tmp_path):
+        1 / 0
+    assert not list(tmp_path.glob("failed.tar*"))
+
+    sink = ArchiveSink(tmp_path / "unfinished.zip", tmp_path)
+    sink._file.close()  # the archive cannot be finished
+    with pytest.raises(ValueError):
+        sink.close()
+    assert not list(tmp_path.glob("unfinished.zip*"))
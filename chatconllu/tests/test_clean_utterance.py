@@ -0,0 +1,17 @@
+import pytest
+from helpers.clean_utterance import normalise_utterance
+
+
+@pytest.mark.parametrize("line, toks",
+                        [
+                        ("yyy :: [::x] [:: x] [//]", []),
+                        ("a, [:x] [: bch] a[/]", ['bch']),
+                        ("a [: b] [: c] [/] d", ['d']),
+                        ("a b [: c] [/] d [: e] [//] g", ['a', 'g']),
+                        ("xxx a [::y] [: z] [/?] b .", ['b', '.']),
+                        ])
+def test_glued_replacement_then_retrace(line, toks):
+    # a retrace after replacements must give the same tokens as rewriting
+    # the whole scope with replace_token()
+    assert normalise_utterance(line)[0] == toks
+    assert normalise_utterance(line, fast=False)[0] == toks